@@ -0,0 +1,28 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import os
+import tempfile
+
+# Benchmarks only ever talk to the local fake Duo server, so provide dummy credentials
+# before config.config is imported (real values in .env are never needed here).
+os.environ.setdefault('APP_VERSION', '1.0')
+os.environ.setdefault('LOGGER_LEVEL', 'WARNING')
+os.environ.setdefault('USERS_SNAPSHOT_PATH', '')  # Never overwrite the real on-disk directory snapshot
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'helpdesk-benchmarks.log'))  # Nor append to the real app log
+os.environ.setdefault('DUO_API_URL', 'https://api-16b8c3ed.duosecurity.com')
+os.environ.setdefault('DUO_IKEY', 'DIBENCHMARKAUTHIKEY0')
+os.environ.setdefault('DUO_SKEY', 'benchmark-auth-secret-key')
+os.environ.setdefault('DUO_ADMIN_API_URL', 'https://api-16b8c3ed.duosecurity.com')
+os.environ.setdefault('DUO_ADMIN_IKEY', 'DIBENCHMARKADMINIKEY')
+os.environ.setdefault('DUO_ADMIN_SKEY', 'benchmark-admin-secret-key')
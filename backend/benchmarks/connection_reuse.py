@@ -0,0 +1,57 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Count TLS handshakes per directory sync with and without keep-alive pooling.
+
+Usage (from backend/):
+    python -m benchmarks.connection_reuse --tenant-size 5000
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import DuoAuthenticator
+
+
+async def sync_once(settings, keepalive):
+    authenticator = DuoAuthenticator(settings)
+    if not keepalive:
+        # Close every connection after its response, like the old module-level requests.get calls
+        authenticator.limits = httpx.Limits(max_connections=settings.DUO_HTTP_POOL_SIZE, max_keepalive_connections=0)
+    start = time.perf_counter()
+    users = await authenticator.fetch_users()
+    elapsed = time.perf_counter() - start
+    await authenticator.aclose()
+    return len(users), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TLS handshakes per directory sync against a fake Duo server')
+    parser.add_argument('--tenant-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_fake_duo_app(tenant_size=args.tenant_size)
+    with FakeDuoServer(app) as server:
+        settings = config.model_copy(update=server.settings_overrides())
+        for label, keepalive in (('no keep-alive', False), ('pooled', True)):
+            app.state.connections.clear()
+            count, elapsed = asyncio.run(sync_once(settings, keepalive))
+            print(f'{label:14} {count} users, {len(app.state.connections):4} handshakes, {elapsed:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
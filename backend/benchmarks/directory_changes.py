@@ -0,0 +1,56 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Bytes a client downloads per refresh: the whole /users/ list vs a /users/changes delta.
+
+Usage (from backend/):
+    python -m benchmarks.directory_changes --tenant-size 50000 --churn 0.001
+"""
+
+import argparse
+import copy
+import time
+
+from benchmarks.fake_duo import make_tenant
+from directory_changes import DirectoryChanges
+from directory_store import dumps
+from duo_app import duo_authenticator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full directory vs delta payload size')
+    parser.add_argument('--tenant-size', type=int, default=50000)
+    parser.add_argument('--churn', type=float, nargs='+', default=[0.0, 0.001, 0.01])
+    args = parser.parse_args()
+
+    users = duo_authenticator.shape_users(make_tenant(args.tenant_size))
+    full = len(dumps({"output": users}))
+    changes = DirectoryChanges()
+    changes.update(users)
+    print(f'full /users/: {len(users)} users, {full / 1e6:.2f} MB')
+
+    for churn in args.churn:
+        step = int(1 / churn) if churn else 0
+        cursor = changes.cursor
+        refreshed = [copy.copy(user) for user in users]
+        for user in refreshed[::step] if step else ():
+            user.status = 'bypass'
+        start = time.perf_counter()
+        changes.update(refreshed)
+        diff_time = time.perf_counter() - start
+        delta = len(dumps({"output": changes.since(cursor)}))
+        print(f'churn {churn:6.2%}: diff {diff_time * 1000:6.1f}ms, delta {delta:9} bytes ({delta / full:.4%} of full)')
+        users = refreshed
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Memory held by one cached directory, and the time to serialise it as the /users/ response and as NDJSON,
+for the previous shape (a dict per user and device) vs DirectoryUser records.
+
+Usage (from backend/):
+    python -m benchmarks.directory_memory --tenant-size 10000 100000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.fake_duo import make_tenant
+from directory_store import dumps
+from duo_app import duo_authenticator
+
+
+def shape_as_dicts(users):
+    # What shape_users returned before DirectoryUser
+    result = []
+    for user in users:
+        if user['status'] != 'active' and user['status'] != 'bypass':
+            continue
+        devices = []
+        for phone in user['phones']:
+            if phone['activated']:
+                capabilities = [c for c in phone['capabilities'] if c != 'auto']
+                devices.append({'id': phone['phone_id'], 'type': 'phone', 'capabilities': capabilities,
+                                'model': phone['model'], 'number': phone['number']})
+        result.append({'username': user['username'], 'fullname': user['realname'], 'email': user['email'],
+                       'status': user['status'], 'devices': devices})
+    return result
+
+
+SHAPES = {
+    'dicts': (shape_as_dicts,
+              # FastAPI ran jsonable_encoder over the returned dict, then JSONResponse rendered it
+              lambda users: json.dumps(jsonable_encoder({"output": users}), ensure_ascii=False, separators=(',', ':')),
+              lambda users: ''.join([json.dumps(user) + '\n' for user in users])),
+    'records': (duo_authenticator.shape_users,
+                lambda users: dumps({"output": users}),
+                lambda users: ''.join([user.to_json() + '\n' for user in users])),
+}
+
+
+def retained(build):
+    # Bytes still allocated once build() returns and its temporaries are gone
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(fn, users):
+    start = time.perf_counter()
+    text = fn(users)
+    return time.perf_counter() - start, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Directory memory and serialisation: dicts vs DirectoryUser records')
+    parser.add_argument('--tenant-size', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'tenant':>7} {'shape':8} {'memory MB':>10} {'bytes/user':>11} {'/users/ ms':>11} {'ndjson ms':>10}")
+    for tenant_size in args.tenant_size:
+        raw = json.dumps(make_tenant(tenant_size))  # Every shape starts from freshly decoded Admin API pages
+        documents = {}
+        for name, (shape, document, ndjson) in SHAPES.items():
+            users, size = retained(lambda: shape(json.loads(raw)))
+            document_time, documents[name] = timed(document, users)
+            ndjson_time, _ = timed(ndjson, users)
+            print(f'{tenant_size:7} {name:8} {size / 1e6:10.1f} {size / len(users):11.0f} '
+                  f'{document_time * 1000:11.0f} {ndjson_time * 1000:10.0f}')
+            del users
+        assert json.loads(documents['dicts']) == json.loads(documents['records'])
+
+
+if __name__ == '__main__':
+    main()
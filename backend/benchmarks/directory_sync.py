@@ -0,0 +1,55 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Time a full fetch_users sync, serial vs parallel page fetching, against a fake Admin API with latency.
+
+Usage (from backend/):
+    python -m benchmarks.directory_sync --tenant-size 20000 --latency 0.05 --concurrency 1 4 8
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import DuoAuthenticator
+
+
+async def sync_once(settings):
+    authenticator = DuoAuthenticator(settings)
+    start = time.perf_counter()
+    users = await authenticator.fetch_users()
+    elapsed = time.perf_counter() - start
+    await authenticator.aclose()
+    return users, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Directory sync time against a fake Admin API')
+    parser.add_argument('--tenant-size', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    with FakeDuoServer(create_fake_duo_app(tenant_size=args.tenant_size, latency=args.latency)) as server:
+        baseline = None
+        for concurrency in args.concurrency:
+            settings = config.model_copy(update={**server.settings_overrides(), 'DUO_ADMIN_SYNC_CONCURRENCY': concurrency})
+            users, elapsed = asyncio.run(sync_once(settings))
+            baseline = baseline or users
+            same = 'identical' if users == baseline else 'DIFFERENT'
+            print(f'concurrency {concurrency:3}: {len(users)} users in {elapsed:6.2f}s ({same} result)')
+
+
+if __name__ == '__main__':
+    main()
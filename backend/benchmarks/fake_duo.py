@@ -0,0 +1,287 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import hmac
+import pathlib
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, quote
+
+import uvicorn
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from config.config import config
+
+
+def generate_self_signed_cert(directory):
+    """
+    Create a throwaway certificate for 127.0.0.1 so the fake server can speak TLS like Duo does.
+    Returns (certfile, keyfile); the certfile doubles as the CA bundle for the client.
+    """
+    directory = pathlib.Path(directory)
+    certfile = directory / 'fake_duo.pem'
+    keyfile = directory / 'fake_duo.key'
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-keyout', str(keyfile), '-out', str(certfile),
+         '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+        check=True, capture_output=True,
+    )
+    return str(certfile), str(keyfile)
+
+
+def make_tenant(size):
+    """
+    Build size Admin API user records; every tenth user is disabled and every third has no activated phone.
+    """
+    users = []
+    for i in range(size):
+        phones = [{
+            'phone_id': f'DP{i:08d}',
+            'activated': i % 3 != 0,
+            'capabilities': ['auto', 'push', 'sms', 'phone', 'mobile_otp'],
+            'model': 'Apple iPhone 15',
+            'number': f'+1555{i:07d}',
+        }]
+        users.append({
+            'user_id': f'DU{i:08d}',
+            'username': f'user{i:06d}',
+            'realname': f'Test User {i}',
+            'email': f'user{i:06d}@example.com',
+            'status': 'disabled' if i % 10 == 9 else 'active',
+            'phones': phones,
+        })
+    return users
+
+
+class InvalidSignature(Exception):
+    pass
+
+
+def duo_signature(skey, date, method, host, path, params):
+    """
+    HMAC-SHA1 over Duo's canonical request, computed independently of DuoAuthenticator.generate_headers.
+    """
+    args = '&'.join(f"{quote(key, '~')}={quote(value, '~')}" for key, value in sorted(params.items()))
+    canon = '\n'.join([date, method.upper(), host.lower(), path, args])
+    return hmac.new(skey.encode(), canon.encode(), hashlib.sha1).hexdigest()
+
+
+def create_fake_duo_app(approval_delay=2.0, push_result='allow', valid_passcode='123456', tenant_size=1000,
+                        latency=0.0, auth_keys=None, admin_keys=None, approval_jitter=0.0, long_poll=0.0,
+                        rate_limit=0.0, tail_rate=0.0, tail_latency=0.0):
+    """
+    Minimal stand-in for the Duo Auth and Admin APIs. Every request must be signed with auth_keys or
+    admin_keys ((ikey, skey), defaulting to the configured integrations). Pushes are approved (or denied)
+    approval_delay plus up to approval_jitter seconds after they are sent; the moment is recorded in
+    app.state.approved_at[txid]. With long_poll, auth_status holds a waiting request for up to that many
+    seconds until the push is answered. /admin/v1/users pages through a generated tenant; preauth and pushes
+    deny its disabled users and ask users without an activated phone to enroll (unknown users get a phone).
+    Every response is delayed by latency seconds to mimic the round trip to Duo. With rate_limit, requests
+    beyond that many per second (bursts of up to one second's worth) get Duo's 429 response. A tail_rate
+    share of responses takes tail_latency longer. Setting app.state.outage to 'error' makes every call fail
+    with 503, 'hang' makes every call hang until it is cleared.
+    """
+    auth_keys = auth_keys or (config.DUO_IKEY, config.DUO_SKEY)
+    admin_keys = admin_keys or (config.DUO_ADMIN_IKEY, config.DUO_ADMIN_SKEY)
+    app = FastAPI()
+    app.state.approved_at = {}  # txid -> monotonic time the push is answered
+    app.state.denied = set()  # txids of pushes to users who can't authenticate
+    app.state.users = make_tenant(tenant_size)
+    by_username = {user['username']: user for user in app.state.users}
+    app.state.connections = set()  # (ip, port) of every client connection, i.e. one TLS handshake each
+    app.state.requests = collections.Counter()  # path -> count
+    app.state.signature_failures = 0
+    app.state.throttled = 0
+    app.state.outage = None
+    limiter = {'tokens': rate_limit, 'updated': time.monotonic()}
+
+    @app.middleware('http')
+    async def simulate_network(request: Request, call_next):
+        app.state.connections.add(tuple(request.scope['client']))
+        app.state.requests[request.url.path] += 1
+        while app.state.outage == 'hang':
+            await asyncio.sleep(0.1)  # Hung requests are released once the outage is cleared
+        if app.state.outage == 'error':
+            return JSONResponse({'stat': 'FAIL', 'code': 50301, 'message': 'Service Unavailable'}, status_code=503)
+        if latency:
+            await asyncio.sleep(latency)
+        if tail_rate and random.random() < tail_rate:
+            await asyncio.sleep(tail_latency)
+        if rate_limit:
+            now = time.monotonic()
+            limiter['tokens'] = min(rate_limit, limiter['tokens'] + (now - limiter['updated']) * rate_limit)
+            limiter['updated'] = now
+            if limiter['tokens'] < 1:
+                app.state.throttled += 1
+                return JSONResponse({'stat': 'FAIL', 'code': 42901, 'message': 'Too Many Requests'}, status_code=429)
+            limiter['tokens'] -= 1
+        return await call_next(request)
+
+    @app.exception_handler(InvalidSignature)
+    async def invalid_signature(request: Request, exc: InvalidSignature):
+        app.state.signature_failures += 1
+        return JSONResponse({'stat': 'FAIL', 'code': 40103, 'message': 'Invalid signature in request credentials',
+                             'message_detail': str(exc)}, status_code=401)
+
+    async def signed_params(request: Request):
+        if request.method == 'POST':
+            query = (await request.body()).decode()
+        else:
+            query = request.url.query
+        params = {key: values[0] for key, values in parse_qs(query, keep_blank_values=True).items()}
+        ikey, skey = admin_keys if request.url.path.startswith('/admin') else auth_keys
+        try:
+            scheme, credentials = request.headers['Authorization'].split(' ', 1)
+            sent_ikey, sent_signature = base64.b64decode(credentials).decode().split(':', 1)
+            date = request.headers['Date']
+        except (KeyError, ValueError) as e:
+            raise InvalidSignature(f'Malformed credentials: {e}')
+        expected = duo_signature(skey, date, request.method, request.headers['Host'], request.url.path, params)
+        if scheme != 'Basic' or sent_ikey != ikey or not hmac.compare_digest(sent_signature, expected):
+            raise InvalidSignature(f'Bad signature for {request.method} {request.url.path}')
+        return params
+
+    def preauth_response(username):
+        user = by_username.get(username)
+        if user is not None and user['status'] == 'disabled':
+            return {'result': 'deny', 'status_msg': 'Your account is disabled.'}
+        phones = user['phones'] if user is not None else [{
+            'phone_id': 'DPFAKE', 'activated': True, 'capabilities': ['auto', 'push', 'sms'], 'model': 'Fake', 'number': '',
+        }]
+        devices = [{'device': phone['phone_id'], 'type': 'phone', 'number': phone['number'],
+                    'display_name': f"{phone['model']} ({phone['number']})", 'capabilities': phone['capabilities']}
+                   for phone in phones if phone['activated']]
+        if not devices:
+            return {'result': 'enroll', 'status_msg': 'Enroll an authentication device to proceed', 'enroll_portal_url': ''}
+        return {'result': 'auth', 'status_msg': 'Account is active', 'devices': devices}
+
+    @app.post('/auth/v2/preauth')
+    async def preauth(form: dict = Depends(signed_params)):
+        return {'stat': 'OK', 'response': preauth_response(form.get('username', ''))}
+
+    @app.post('/auth/v2/auth')
+    async def auth(form: dict = Depends(signed_params)):
+        can_auth = preauth_response(form.get('username', ''))['result'] == 'auth'
+        if form.get('factor') == 'passcode':
+            result = 'allow' if can_auth and form.get('passcode') == valid_passcode else 'deny'
+            return {'stat': 'OK', 'response': {'result': result, 'status': result, 'status_msg': result}}
+        txid = str(uuid.uuid4())
+        if can_auth:
+            app.state.approved_at[txid] = time.monotonic() + approval_delay + random.uniform(0, approval_jitter)
+        else:
+            app.state.approved_at[txid] = time.monotonic()
+            app.state.denied.add(txid)
+        return {'stat': 'OK', 'response': {'txid': txid}}
+
+    @app.get('/auth/v2/auth_status')
+    async def auth_status(txid: str, _: dict = Depends(signed_params)):
+        approved_at = app.state.approved_at.get(txid)
+        if approved_at is None:
+            return {'stat': 'FAIL', 'code': 40002, 'message': 'Invalid request parameters', 'message_detail': 'txid'}
+        if long_poll and time.monotonic() < approved_at:
+            await asyncio.sleep(min(approved_at - time.monotonic(), long_poll))
+        if time.monotonic() < approved_at:
+            return {'stat': 'OK', 'response': {'result': 'waiting', 'status': 'pushed', 'status_msg': 'Pushed a login request to your device...'}}
+        result = 'deny' if txid in app.state.denied else push_result
+        return {'stat': 'OK', 'response': {'result': result, 'status': result, 'status_msg': result}}
+
+    @app.get('/admin/v1/users')
+    async def users(limit: int = 100, offset: int = 0, _: dict = Depends(signed_params)):
+        users = app.state.users
+        page = users[offset:offset + limit]
+        metadata = {'total_objects': len(users), 'prev_offset': max(offset - limit, 0)}
+        if offset + limit < len(users):
+            metadata['next_offset'] = offset + limit
+        # Skip FastAPI's jsonable_encoder pass so the fake server isn't the bottleneck
+        return JSONResponse({'stat': 'OK', 'response': page, 'metadata': metadata})
+
+    return app
+
+
+class FakeDuoServer:
+    """
+    Run a fake Duo app over TLS on 127.0.0.1 in a background thread.
+
+    with FakeDuoServer(create_fake_duo_app()) as server:
+        settings = config.model_copy(update=server.settings_overrides())
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.certfile, self.keyfile = generate_self_signed_cert(self._tmpdir.name)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self.port = self._sock.getsockname()[1]
+        self.url = f'https://127.0.0.1:{self.port}'
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, log_level='warning', ssl_certfile=self.certfile, ssl_keyfile=self.keyfile,
+        ))
+        self._thread = threading.Thread(target=self._server.run, kwargs={'sockets': [self._sock]}, daemon=True)
+
+    def settings_overrides(self):
+        # Point both the Auth and Admin API at this server (bypasses the DUO_API_URL validator)
+        return {'DUO_API_URL': self.url, 'DUO_ADMIN_API_URL': self.url, 'DUO_CA_BUNDLE': self.certfile}
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+        self._sock.close()
+        self._tmpdir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Duo Auth/Admin API server')
+    parser.add_argument('--tenant-size', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--approval-delay', type=float, default=2.0, help='Seconds before a push is answered')
+    parser.add_argument('--approval-jitter', type=float, default=0.0, help='Extra random seconds before a push is answered')
+    parser.add_argument('--long-poll', type=float, default=0.0, help='Seconds auth_status may hold a waiting request')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second before answering 429')
+    parser.add_argument('--push-result', choices=['allow', 'deny'], default='allow')
+    args = parser.parse_args()
+
+    app = create_fake_duo_app(approval_delay=args.approval_delay, push_result=args.push_result,
+                              tenant_size=args.tenant_size, latency=args.latency,
+                              approval_jitter=args.approval_jitter, long_poll=args.long_poll,
+                              rate_limit=args.rate_limit)
+    with FakeDuoServer(app) as server:
+        print(f'Fake Duo listening on {server.url} (CA bundle: {server.certfile}); Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
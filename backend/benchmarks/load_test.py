@@ -0,0 +1,148 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Load-test the helpdesk API against the fake Duo server and report latency percentiles and throughput.
+
+The FastAPI app runs in-process (ASGI transport, so uvicorn's HTTP parsing is not measured) with the
+shared DuoAuthenticator pointed at the fake server. A "push" operation is a full verification:
+POST /push/ followed by waiting on /push/{txid}/events for the result.
+
+Usage (from backend/):
+    python -m benchmarks.load_test --scenario users search token --concurrency 50 --requests 2000
+    python -m benchmarks.load_test --scenario push --concurrency 200 --requests 200 --approval-delay 1
+    python -m benchmarks.load_test --output results.json  # Save the numbers to compare later runs
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+from main import create_app
+
+
+def user_payload(i, token=None):
+    return {'username': f'caller{i:06d}', 'fullname': f'Test Caller {i}', 'email': f'caller{i:06d}@example.com',
+            'status': 'active', 'devices': [], 'token': token}
+
+
+async def op_push(client, i):
+    response = (await client.post('/push/', json=user_payload(i))).raise_for_status().json()
+    events = (await client.get(f"/push/{response['txid']}/events")).raise_for_status().text
+    data = next(line for line in events.splitlines() if line.startswith('data: '))
+    if json.loads(data[len('data: '):])['output'] not in ('allow', 'deny'):
+        raise RuntimeError(data)
+
+
+async def op_token(client, i):
+    (await client.post('/token/', json=user_payload(i, token='123456'))).raise_for_status()
+
+
+async def op_users(client, i):
+    (await client.get('/users/')).raise_for_status()
+
+
+async def op_search(client, i):
+    (await client.get('/users/search', params={'q': f'user{random.randrange(1000):03d}'})).raise_for_status()
+
+
+async def op_changes(client, i):
+    version = (await client.get('/users/changes')).raise_for_status().json()['output']['version']
+    (await client.get('/users/changes', params={'since': version})).raise_for_status()
+
+
+SCENARIOS = {'push': op_push, 'token': op_token, 'users': op_users, 'search': op_search, 'changes': op_changes}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+async def run_scenario(client, operation, concurrency, requests):
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await operation(client, i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+
+
+async def run(args):
+    app = create_app()
+    results = {}
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk', timeout=None) as client:
+        (await client.get('/users/')).raise_for_status()  # Warm the directory cache before measuring
+        for name in args.scenario:
+            results[name] = await run_scenario(client, SCENARIOS[name], args.concurrency, args.requests)
+    await duo_authenticator.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the helpdesk API against a fake Duo server')
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=['users', 'search', 'token'])
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000, help='Operations per scenario')
+    parser.add_argument('--tenant-size', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the fake Duo adds to every response')
+    parser.add_argument('--approval-delay', type=float, default=1.0, help='Seconds before a push is approved')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    fake = create_fake_duo_app(approval_delay=args.approval_delay, tenant_size=args.tenant_size, latency=args.latency)
+    with FakeDuoServer(fake) as server:
+        duo_authenticator.configure(config.model_copy(update=server.settings_overrides()))
+        with contextlib.redirect_stdout(io.StringIO()):  # /users/ prints "Fetching users..." on every request
+            results = asyncio.run(run(args))
+
+    print(f"{'scenario':10} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:10} {r['concurrency']:5} {r['requests']:6} {r['errors']:6} {r['rps']:9.1f} "
+              f"{r['p50_ms'] or 0:9.1f} {r['p95_ms'] or 0:9.1f} {r['p99_ms'] or 0:9.1f}")
+    print(f"fake Duo: {dict(fake.state.requests)}, signature failures: {fake.state.signature_failures}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Log a burst of records and report, per logging mode, how fast the application could log (records/sec
+until the burst was queued), how fast records reached the log file (records/sec until the listener
+drained the queue), the backlog left in memory when the burst ended and how many records were shed.
+
+Usage (from backend/):
+    python -m benchmarks.logging_throughput --records 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from rich.console import Console
+
+from config.config import config
+from logrr import LoggerManager, process_log_file
+
+MODES = {
+    'dev': {'LOG_MODE': 'dev'},
+    'production/drop': {'LOG_MODE': 'production', 'LOG_PRODUCTION_OUTPUT': 'file', 'LOG_QUEUE_POLICY': 'drop'},
+    'production/sample': {'LOG_MODE': 'production', 'LOG_PRODUCTION_OUTPUT': 'file', 'LOG_QUEUE_POLICY': 'sample'},
+}
+
+
+def run(name, overrides, records, directory):
+    log_file = os.path.join(directory, f"{name.replace('/', '-')}.log")
+    settings = config.model_copy(update={**overrides, 'LOG_FILE': log_file, 'LOGGER_LEVEL': 'INFO'})
+    with open(os.devnull, 'w') as devnull:
+        # Rich still renders every record in dev mode, the terminal just doesn't have to draw it
+        manager = LoggerManager(settings, console=Console(file=devnull, force_terminal=True, width=160), name=f'bench.{name}')
+        start = time.perf_counter()
+        for i in range(records):
+            manager.logger.info('Push %s for %s: %s', f'TX{i:08d}', f'user{i % 1000:06d}', 'allow', extra={'route': '/push/'})
+        queued = time.perf_counter() - start
+        backlog = manager.log_queue.qsize()
+        stats = manager.stats()
+        manager.shutdown()
+        written = time.perf_counter() - start
+    with open(log_file if overrides['LOG_MODE'] == 'dev' else process_log_file(log_file)) as f:
+        lines = sum(1 for _ in f)
+    return queued, written, backlog, stats, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logging throughput in dev and production mode')
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'mode':18} {'logged/s':>10} {'written/s':>10} {'backlog':>8} {'dropped':>8} {'sampled':>8} {'lines':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, overrides in MODES.items():
+            queued, written, backlog, stats, lines = run(name, overrides, args.records, directory)
+            print(f"{name:18} {args.records / queued:10.0f} {args.records / written:10.0f} {backlog:8} "
+                  f"{stats['dropped']:8} {stats['sampled_out']:8} {lines:8}")
+
+
+if __name__ == '__main__':
+    main()
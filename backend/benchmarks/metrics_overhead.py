@@ -0,0 +1,68 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Cost of metrics on the hot path: a cheap route served with and without PrometheusMiddleware, the
+per-call cost of recording one Duo round trip, and how long a /metrics scrape takes.
+
+Usage (from backend/):
+    python -m benchmarks.metrics_overhead --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+import timeit
+
+import httpx
+
+from main import create_app
+from metrics import DUO_REQUEST_DURATION, PrometheusMiddleware, child
+
+
+async def timed_requests(app, requests):
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk') as client:
+        await client.get('/users/cache')  # Build the middleware stack
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get('/users/cache')
+        return (time.perf_counter() - start) / requests
+
+
+async def timed_scrape(app):
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk') as client:
+        start = time.perf_counter()
+        response = await client.get('/metrics')
+        return time.perf_counter() - start, len(response.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Overhead of request and Duo call metrics')
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    bare = create_app()
+    bare.user_middleware = [m for m in bare.user_middleware if m.cls is not PrometheusMiddleware]
+    per_request = {}
+    for name, app in (('without metrics', bare), ('with metrics', create_app())):
+        per_request[name] = asyncio.run(timed_requests(app, args.requests))
+        print(f'{name:16} {per_request[name] * 1e6:8.1f} us/request')
+    print(f"{'overhead':16} {(per_request['with metrics'] - per_request['without metrics']) * 1e6:8.1f} us/request")
+
+    calls = 200000
+    seconds = timeit.timeit(lambda: child(DUO_REQUEST_DURATION, '/auth/v2/auth', 'api.example.com', 'OK').observe(0.1), number=calls)
+    print(f"{'Duo call':16} {seconds / calls * 1e6:8.2f} us/observation")
+    seconds, size = asyncio.run(timed_scrape(create_app()))
+    print(f"{'scrape':16} {seconds * 1000:8.1f} ms ({size} bytes)")
+
+
+if __name__ == '__main__':
+    main()
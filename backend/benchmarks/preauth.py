@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Time an agent's "Send push" click until the helpdesk knows the outcome, for users who can approve a push
+(until the push is on their phone) and for locked-out or unenrolled users (until the final answer).
+Compared without preauth, with preauth fetched on demand, and with preauth prefetched on user selection.
+
+Usage (from backend/):
+    python -m benchmarks.preauth --users 20 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+from main import create_app
+from preauth_cache import preauth_cache
+
+# Tenant users (see make_tenant): every tenth is disabled, every third has no activated phone
+GROUPS = {
+    'can push': lambda n: n % 3 and n % 10 != 9,
+    'locked out': lambda n: n % 10 == 9,
+    'not enrolled': lambda n: n % 3 == 0 and n % 10 != 9,
+}
+MODES = {
+    'no preauth': (False, False),
+    'on demand': (True, False),
+    'prefetched': (True, True),
+}
+
+
+def user_payload(n):
+    return {'username': f'user{n:06d}', 'fullname': f'Test User {n}', 'email': f'user{n:06d}@example.com',
+            'status': 'active', 'devices': []}
+
+
+async def click_push(client, n):
+    start = time.perf_counter()
+    response = (await client.post('/push/', json=user_payload(n))).raise_for_status().json()
+    if 'txid' not in response:
+        return time.perf_counter() - start, response['output']
+    pushed = time.perf_counter() - start
+    events = (await client.get(f"/push/{response['txid']}/events")).text
+    data = next(line for line in events.splitlines() if line.startswith('data: '))
+    output = json.loads(data[len('data: '):])['output']
+    # A push that reached a phone counts until it was sent; a doomed one until its final answer
+    return (pushed if output == 'allow' else time.perf_counter() - start), output
+
+
+async def run(fake, users, enabled, prefetch, offset):
+    preauth_cache.enabled = enabled
+    preauth_cache.entries.clear()
+    app = create_app()
+    results = {}
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk', timeout=None) as client:
+        for group, member in GROUPS.items():
+            numbers = [n for n in range(offset, offset + users * 10) if member(n)][:users]
+            if prefetch:
+                # The agents selected their users a moment before clicking
+                await asyncio.gather(*(client.get(f'/users/user{n:06d}/preauth') for n in numbers))
+            before = fake.state.requests['/auth/v2/auth']
+            outcomes = await asyncio.gather(*(click_push(client, n) for n in numbers))
+            results[group] = ([latency for latency, _ in outcomes], {output for _, output in outcomes},
+                              fake.state.requests['/auth/v2/auth'] - before)
+    await duo_authenticator.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Push click-to-outcome time with and without the preauth cache')
+    parser.add_argument('--users', type=int, default=20, help='Users per group')
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = create_fake_duo_app(approval_delay=1.0, latency=args.latency, tenant_size=args.users * 100)
+    print(f"{'mode':12} {'users':13} {'p50 ms':>8} {'max ms':>8} {'pushes sent':>12}  outputs")
+    with FakeDuoServer(fake) as server:
+        duo_authenticator.configure(config.model_copy(update=server.settings_overrides()))
+        for i, (mode, (enabled, prefetch)) in enumerate(MODES.items()):
+            # Fresh users per mode, so no pushes are still pending from the previous one
+            results = asyncio.run(run(fake, args.users, enabled, prefetch, offset=i * args.users * 30))
+            for group, (latencies, outputs, pushes) in results.items():
+                print(f"{mode:12} {group:13} {statistics.median(latencies) * 1000:8.0f} {max(latencies) * 1000:8.0f} "
+                      f"{pushes:12}  {sorted(outputs)}")
+
+
+if __name__ == '__main__':
+    main()
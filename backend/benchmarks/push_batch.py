@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Verify a group of users through /push/batch and compare the wall time with a single push.
+
+Usage (from backend/):
+    python -m benchmarks.push_batch --users 200 --approval-delay 2 --approval-jitter 3
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+from main import create_app
+
+
+def user_payload(i):
+    return {'username': f'caller{i:06d}', 'fullname': f'Test Caller {i}', 'email': f'caller{i:06d}@example.com',
+            'status': 'active', 'devices': []}
+
+
+async def timed_batch(client, users, concurrency):
+    start = time.perf_counter()
+    first = None
+    results = collections.Counter()
+    async with client.stream('POST', '/push/batch', json=users, params={'concurrency': concurrency}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                first = first or time.perf_counter() - start
+                results[json.loads(line)['result']] += 1
+    return time.perf_counter() - start, first, results
+
+
+async def run(helpdesk, args):
+    async with httpx.AsyncClient(base_url=helpdesk.url, verify=helpdesk.certfile, timeout=None) as client:
+        single, _, _ = await timed_batch(client, [user_payload(args.users)], 1)
+        batch = await timed_batch(client, [user_payload(i) for i in range(args.users)], args.concurrency)
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wall time of /push/batch against a fake Duo server')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=config.PUSH_BATCH_CONCURRENCY)
+    parser.add_argument('--approval-delay', type=float, default=2.0)
+    parser.add_argument('--approval-jitter', type=float, default=3.0)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    fake = create_fake_duo_app(approval_delay=args.approval_delay, approval_jitter=args.approval_jitter,
+                               latency=args.latency)
+    with FakeDuoServer(fake) as server:
+        duo_authenticator.configure(config.model_copy(update=server.settings_overrides()))
+        # Served by uvicorn rather than httpx's ASGI transport, which buffers the whole streamed body
+        with FakeDuoServer(create_app()) as helpdesk:
+            single, (batch, first, results) = asyncio.run(run(helpdesk, args))
+
+    print(f'1 push:               {single:6.2f}s')
+    print(f'{args.users} users, concurrency {args.concurrency}: {batch:6.2f}s  (first result after {first:.2f}s)')
+    print(f'one by one (estimate): {(args.approval_delay + args.approval_jitter / 2) * args.users:6.0f}s')
+    print(f'results:              {dict(results)}')
+    print(f'Duo calls:            {dict(fake.state.requests)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Measure the time from a push being approved on the (fake) device to check_auth_status returning,
+and the number of auth_status polls per push, for several polling schedules.
+
+    fixed-5s    the old schedule: a poll every 5 seconds
+    adaptive    PUSH_STATUS_POLL_* from config (fast first, backing off)
+    long-poll   adaptive, against a server that holds auth_status until the push is answered
+
+Usage (from backend/):
+    python -m benchmarks.push_latency --pushes 100 --approval-delay 1 --approval-jitter 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+
+SCHEDULES = {
+    'fixed-5s': ({'PUSH_STATUS_POLL_MIN_INTERVAL': 5.0, 'PUSH_STATUS_POLL_MAX_INTERVAL': 5.0}, 0.0),
+    'adaptive': ({}, 0.0),
+    'long-poll': ({}, 25.0),
+}
+
+
+async def push_and_wait(fake, i):
+    response = await duo_authenticator.start_push({'username': f'caller{i:06d}'})
+    txid = response['response']['txid']
+    result = await duo_authenticator.check_auth_status(txid)
+    return time.monotonic() - fake.state.approved_at[txid], result
+
+
+async def run(fake, pushes):
+    results = await asyncio.gather(*(push_and_wait(fake, i) for i in range(pushes)))
+    await duo_authenticator.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Approval-to-response latency of check_auth_status')
+    parser.add_argument('--pushes', type=int, default=100)
+    parser.add_argument('--approval-delay', type=float, default=1.0, help='Minimum seconds before the user answers')
+    parser.add_argument('--approval-jitter', type=float, default=10.0, help='Extra random seconds before the user answers')
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"{'schedule':10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'polls/push':>11}  results")
+    for name, (overrides, long_poll) in SCHEDULES.items():
+        fake = create_fake_duo_app(approval_delay=args.approval_delay, approval_jitter=args.approval_jitter,
+                                   latency=args.latency, long_poll=long_poll)
+        with FakeDuoServer(fake) as server:
+            duo_authenticator.configure(config.model_copy(update={**server.settings_overrides(), **overrides}))
+            results = asyncio.run(run(fake, args.pushes))
+        lags = sorted(lag * 1000 for lag, _ in results)
+        polls = fake.state.requests['/auth/v2/auth_status'] / args.pushes
+        print(f"{name:10} {statistics.median(lags):8.0f} {lags[int(len(lags) * 0.95) - 1]:8.0f} {lags[-1]:8.0f} "
+              f"{polls:11.1f}  {sorted(set(result for _, result in results))}")
+
+
+if __name__ == '__main__':
+    main()
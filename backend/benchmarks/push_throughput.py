@@ -0,0 +1,80 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Check that concurrent /push/ requests don't serialise on the event loop: exits with an error when they
+take more than --max-ratio times as long as a single push, or any of them isn't approved.
+
+Usage (from backend/):
+    python -m benchmarks.push_throughput --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+from main import create_app
+
+
+def user_payload(i):
+    return {'username': f'user{i}', 'fullname': f'User {i}', 'email': f'user{i}@example.com', 'status': 'active', 'devices': []}
+
+
+async def push_and_wait(client, i):
+    txid = (await client.post('/push/', json=user_payload(i))).json()['txid']
+    events = (await client.get(f'/push/{txid}/events')).text
+    data = next(line for line in events.splitlines() if line.startswith('data: '))
+    return json.loads(data[len('data: '):])['output']
+
+
+async def timed_pushes(client, count):
+    start = time.perf_counter()
+    outputs = await asyncio.gather(*(push_and_wait(client, i) for i in range(count)))
+    return time.perf_counter() - start, set(outputs)
+
+
+async def run(concurrency):
+    app = create_app()
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk', timeout=None) as client:
+        single, _ = await timed_pushes(client, 1)
+        many, outputs = await timed_pushes(client, concurrency)
+    await duo_authenticator.aclose()
+    return single, many, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent /push/ throughput against a fake Duo server')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--approval-delay', type=float, default=2.0)
+    parser.add_argument('--max-ratio', type=float, default=5.0, help='Most the concurrent pushes may take, in single pushes')
+    args = parser.parse_args()
+
+    with FakeDuoServer(create_fake_duo_app(approval_delay=args.approval_delay)) as server:
+        duo_authenticator.configure(config.model_copy(update=server.settings_overrides()))
+        single, many, outputs = asyncio.run(run(args.concurrency))
+
+    print(f'1 push:                {single:6.2f}s')
+    print(f'{args.concurrency} concurrent pushes: {many:6.2f}s  (outputs: {sorted(map(str, outputs))})')
+    print(f'ratio:                 {many / single:6.2f}x  (serialised would be ~{args.concurrency}x)')
+    if outputs != {'allow'}:
+        raise SystemExit(f'FAIL: expected every push to be approved, got {sorted(map(str, outputs))}')
+    if many / single > args.max_ratio:
+        raise SystemExit(f'FAIL: {args.concurrency} concurrent pushes took {many / single:.2f}x one push (limit {args.max_ratio}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Run a directory sync and a stream of passcode checks at the same time against a fake Duo server that
+answers 429 above --duo-limit requests per second, with and without the outbound scheduler.
+
+Usage (from backend/):
+    python -m benchmarks.rate_limit --tenant-size 20000 --duo-limit 20 --tokens 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+
+
+async def timed_token(i):
+    start = time.perf_counter()
+    result = await duo_authenticator.send_token({'username': f'caller{i:06d}', 'token': '123456'})
+    return time.perf_counter() - start, result
+
+
+async def run(tokens, interval):
+    start = time.perf_counter()
+    sync = asyncio.create_task(duo_authenticator.fetch_users())
+    checks = []
+    for i in range(tokens):
+        checks.append(asyncio.create_task(timed_token(i)))
+        await asyncio.sleep(interval)
+    results = await asyncio.gather(*checks)
+    users = await sync
+    sync_time = time.perf_counter() - start
+    stats = duo_authenticator.scheduler.stats()
+    await duo_authenticator.aclose()
+    return results, users, sync_time, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Directory sync plus passcode checks against a rate-limited fake Duo')
+    parser.add_argument('--tenant-size', type=int, default=20000)
+    parser.add_argument('--duo-limit', type=float, default=20.0, help='Requests per second the fake Duo allows')
+    parser.add_argument('--tokens', type=int, default=50, help='Passcode checks sent during the sync')
+    parser.add_argument('--interval', type=float, default=0.1, help='Seconds between passcode checks')
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    modes = {
+        'unscheduled': {'DUO_RATE_LIMIT_PER_SECOND': 0.0, 'DUO_RATE_LIMIT_RETRIES': 0},
+        '429 backoff': {'DUO_RATE_LIMIT_PER_SECOND': 0.0},
+        'scheduled': {'DUO_RATE_LIMIT_PER_SECOND': args.duo_limit * 0.9, 'DUO_RATE_LIMIT_BURST': 5},
+    }
+    print(f"{'mode':12} {'sync':>8} {'users':>6} {'token p50':>10} {'token p95':>10} {'token errors':>13} {'429s':>6}")
+    for name, overrides in modes.items():
+        fake = create_fake_duo_app(tenant_size=args.tenant_size, latency=args.latency, rate_limit=args.duo_limit)
+        with FakeDuoServer(fake) as server:
+            duo_authenticator.configure(config.model_copy(update={**server.settings_overrides(), **overrides}))
+            results, users, sync_time, stats = asyncio.run(run(args.tokens, args.interval))
+        latencies = sorted(latency * 1000 for latency, result in results if result in ('allow', 'deny'))
+        errors = len(results) - len(latencies)
+        users = len(users) if isinstance(users, list) else users.get('message')
+        p50 = statistics.median(latencies) if latencies else 0
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        print(f"{name:12} {sync_time:7.1f}s {users!s:>6} {p50:9.0f}ms {p95:9.0f}ms {errors:13} {fake.state.throttled:6}")
+        for host, bucket in stats.items():
+            print(f"    {host}: queued {bucket['queued']}, throttled {bucket['throttled']}, retries {bucket['retries']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Two experiments against a misbehaving fake Duo server:
+
+    hedging   directory sync time when a few percent of responses are slow, with and without hedged reads
+    outage    /token/ latency and status codes while Duo hangs every call, with and without the circuit breaker
+
+Usage (from backend/):
+    python -m benchmarks.resilience --tenant-size 20000 --tail-rate 0.05 --tail-latency 2 --hedge-delay 0.2
+"""
+
+import argparse
+import asyncio
+import collections
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from duo_app import duo_authenticator
+from main import create_app
+
+
+async def timed_sync(settings):
+    duo_authenticator.configure(settings)
+    start = time.perf_counter()
+    users = await duo_authenticator.fetch_users()
+    elapsed = time.perf_counter() - start
+    stats = duo_authenticator.stats()['hedging']
+    await duo_authenticator.aclose()
+    return elapsed, len(users), stats
+
+
+async def timed_tokens(settings, requests, concurrency):
+    duo_authenticator.configure(settings)
+    app = create_app()
+    latencies = []
+    statuses = collections.Counter()
+    counter = iter(range(requests))
+
+    async def agent(client):
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.post('/token/', json={'username': f'caller{i:06d}', 'fullname': 'Caller',
+                                                          'status': 'active', 'devices': [], 'token': '123456'})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk', timeout=None) as client:
+        await asyncio.gather(*(agent(client) for _ in range(concurrency)))
+    breakers = duo_authenticator.stats()['breakers']
+    await duo_authenticator.aclose()
+    return sorted(latencies), statuses, breakers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hedged reads and circuit breaking against a misbehaving fake Duo')
+    parser.add_argument('--tenant-size', type=int, default=20000)
+    parser.add_argument('--tail-rate', type=float, default=0.05, help='Share of Duo responses that are slow')
+    parser.add_argument('--tail-latency', type=float, default=2.0, help='Extra seconds for a slow response')
+    parser.add_argument('--hedge-delay', type=float, default=0.2)
+    parser.add_argument('--requests', type=int, default=100, help='/token/ requests during the outage')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--read-timeout', type=float, default=2.0, help='/auth/v2/auth read deadline during the outage')
+    args = parser.parse_args()
+
+    fake = create_fake_duo_app(tenant_size=args.tenant_size, latency=0.02, tail_rate=args.tail_rate,
+                               tail_latency=args.tail_latency)
+    with FakeDuoServer(fake) as server:
+        base = {**server.settings_overrides(), 'DUO_RATE_LIMIT_PER_SECOND': 0.0}
+
+        print(f'hedging: {args.tenant_size} users, {args.tail_rate:.0%} of responses {args.tail_latency}s slower')
+        for name, delay in (('no hedging', 0.0), (f'hedge after {args.hedge_delay}s', args.hedge_delay)):
+            elapsed, users, stats = asyncio.run(timed_sync(config.model_copy(update={**base, 'DUO_HEDGE_DELAY': delay})))
+            print(f'  {name:20} sync {elapsed:6.2f}s  ({users} users, {stats["hedges"]} hedges, {stats["hedge_wins"]} won)')
+
+        print(f'outage: Duo hangs, {args.requests} /token/ requests from {args.concurrency} agents')
+        fake.state.outage = 'hang'
+        timeouts = {**config.DUO_ENDPOINT_READ_TIMEOUTS, '/auth/v2/preauth': args.read_timeout, '/auth/v2/auth': args.read_timeout}
+        for name, min_calls in (('no breaker', 10 ** 9), ('circuit breaker', config.DUO_BREAKER_MIN_CALLS)):
+            settings = config.model_copy(update={**base, 'DUO_ENDPOINT_READ_TIMEOUTS': timeouts, 'DUO_BREAKER_MIN_CALLS': min_calls})
+            start = time.perf_counter()
+            latencies, statuses, breakers = asyncio.run(timed_tokens(settings, args.requests, args.concurrency))
+            elapsed = time.perf_counter() - start
+            states = {host: breaker['state'] for host, breaker in breakers.items()}
+            print(f'  {name:20} total {elapsed:6.2f}s  p50 {statistics.median(latencies) * 1000:7.0f}ms  '
+                  f'statuses {dict(statuses)}  breakers {states}')
+        fake.state.outage = None
+
+
+if __name__ == '__main__':
+    main()
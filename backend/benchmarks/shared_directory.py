@@ -0,0 +1,89 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Start several helpdesk worker processes at once against the fake Admin API, keep them serving /users/
+through a few cache TTLs, and count the /admin/v1/users pages they requested, with and without the
+shared directory.
+
+Usage (from backend/):
+    python -m benchmarks.shared_directory --workers 4 --tenant-size 20000 --ttl 5 --duration 12
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from directory_cache import directory_cache
+from directory_shared import shared_directory
+from duo_app import duo_authenticator
+from main import create_app
+
+
+async def run_worker(overrides, duration):
+    duo_authenticator.configure(config.model_copy(update=overrides))
+    app = create_app()
+    await app.router.startup()
+    start = time.perf_counter()
+    while directory_cache.users is None:
+        await asyncio.sleep(0.05)
+    ready = time.perf_counter() - start
+    role = shared_directory.stats()['role']  # A follower may still take over once the leader exits
+    while time.perf_counter() - start < ready + duration:
+        await directory_cache.get()  # Consoles keep loading /users/, refreshing it once stale
+        await asyncio.sleep(0.2)
+    users = len(directory_cache.users)
+    await app.router.shutdown()
+    return ready, role, shared_directory.reloads, directory_cache.refreshes, users
+
+
+def worker(overrides, duration):
+    # Runs in a fresh (spawned) process that picked up the USERS_* settings from the environment
+    with contextlib.redirect_stdout(io.StringIO()):  # Startup tables
+        return asyncio.run(run_worker(overrides, duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Admin API traffic of several workers, with and without a shared directory')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--tenant-size', type=int, default=20000)
+    parser.add_argument('--ttl', type=int, default=5, help='USERS_CACHE_TTL for the workers')
+    parser.add_argument('--duration', type=float, default=12.0, help='Seconds each worker runs after its first directory')
+    args = parser.parse_args()
+
+    fake = create_fake_duo_app(tenant_size=args.tenant_size, latency=0.02)
+    context = multiprocessing.get_context('spawn')
+    with FakeDuoServer(fake) as server:
+        overrides = server.settings_overrides()
+        for shared in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                os.environ.update({'USERS_SNAPSHOT_PATH': os.path.join(directory, 'users.sqlite3'), 'USERS_SHARED': str(shared),
+                                   'USERS_CACHE_TTL': str(args.ttl), 'USERS_SHARED_POLL_INTERVAL': '0.5'})
+                before = fake.state.requests['/admin/v1/users']
+                with concurrent.futures.ProcessPoolExecutor(args.workers, mp_context=context) as pool:
+                    results = list(pool.map(worker, [overrides] * args.workers, [args.duration] * args.workers))
+                pages = fake.state.requests['/admin/v1/users'] - before
+            print(f"{'shared' if shared else 'per worker':10}  {args.workers} workers  {pages:5} Admin API pages  "
+                  f"first directory after {max(ready for ready, *_ in results):5.2f}s (slowest worker)")
+            for ready, role, reloads, refreshes, users in results:
+                print(f'    {role:8}  ready {ready:5.2f}s  {refreshes} refreshes ({reloads} from the snapshot)  {users} users')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Fire bursts of identical requests at the app (double-clicked pushes, repeated passcodes, consoles
+loading the directory at once) and count the calls that actually reach the fake Duo server.
+
+Usage (from backend/):
+    python -m benchmarks.single_flight --duplicates 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+
+import httpx
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from directory_cache import directory_cache
+from duo_app import duo_authenticator
+from main import create_app
+
+
+def user_payload(token=None):
+    return {'username': 'user000001', 'fullname': 'Test User 1', 'email': 'user000001@example.com',
+            'status': 'active', 'devices': [], 'token': token}
+
+
+async def burst(fake, path, make_request, duplicates):
+    before = fake.state.requests[path]
+    responses = await asyncio.gather(*(make_request() for _ in range(duplicates)))
+    return fake.state.requests[path] - before, responses
+
+
+async def run(fake, duplicates):
+    app = create_app()
+    results = {}
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk', timeout=None) as client:
+        calls, responses = await burst(fake, '/admin/v1/users', lambda: client.get('/users/', params={'stream': True}), duplicates)
+        results['users (cold, streamed)'] = (calls, len({r.text for r in responses}))
+        calls, responses = await burst(fake, '/auth/v2/auth', lambda: client.post('/push/', json=user_payload()), duplicates)
+        results['push'] = (calls, len({r.json()['txid'] for r in responses}))
+        calls, responses = await burst(fake, '/auth/v2/auth', lambda: client.post('/token/', json=user_payload('123456')), duplicates)
+        results['token'] = (calls, len({r.text for r in responses}))
+        stats = duo_authenticator.single_flight.stats()
+    await directory_cache.shutdown()
+    await duo_authenticator.aclose()
+    return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Duo calls made for bursts of duplicate requests')
+    parser.add_argument('--duplicates', type=int, default=20)
+    parser.add_argument('--tenant-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    fake = create_fake_duo_app(tenant_size=args.tenant_size, latency=0.05, approval_delay=5.0)
+    with FakeDuoServer(fake) as server:
+        duo_authenticator.configure(config.model_copy(update=server.settings_overrides()))
+        with contextlib.redirect_stdout(io.StringIO()):  # /users/ prints "Fetching users..." on every request
+            results, stats = asyncio.run(run(fake, args.duplicates))
+
+    pages = -(-args.tenant_size // 100)
+    print(f"{'burst':24} {'requests':>9} {'Duo calls':>10} {'distinct results':>17}  (one directory walk = {pages} calls)")
+    for name, (calls, distinct) in results.items():
+        print(f"{name:24} {args.duplicates:9} {calls:10} {distinct:17}")
+    print(f"single flight: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Size and save/load time of the on-disk user directory snapshot.
+
+Usage (from backend/):
+    python -m benchmarks.snapshot_load --tenant-size 10000 100000
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+
+from benchmarks.fake_duo import make_tenant
+from directory_snapshot import DirectorySnapshot
+from duo_app import duo_authenticator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='User directory snapshot save/load timings')
+    parser.add_argument('--tenant-size', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for tenant_size in args.tenant_size:
+            users = duo_authenticator.shape_users(make_tenant(tenant_size))
+            snapshot = DirectorySnapshot(pathlib.Path(tmpdir) / f'users-{tenant_size}.sqlite3')
+            start = time.perf_counter()
+            snapshot.save(users)
+            saved = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded, _ = snapshot.load()
+            load_time = time.perf_counter() - start
+            assert loaded == users
+            print(f'{len(users):7} users  {snapshot.path.stat().st_size / 1e6:6.2f} MB on disk  '
+                  f'save {saved * 1000:7.1f}ms  load {load_time * 1000:7.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
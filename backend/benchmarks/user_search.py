@@ -0,0 +1,65 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Time UserIndex build, incremental update and search on a generated tenant.
+
+Usage (from backend/):
+    python -m benchmarks.user_search --tenant-size 100000
+"""
+
+import argparse
+import copy
+import statistics
+import time
+
+from benchmarks.fake_duo import make_tenant
+from directory_changes import DirectoryDelta
+from duo_app import duo_authenticator
+from user_index import UserIndex
+
+QUERIES = ['u', 'user0', 'user012345', 'test user 4', 'example', 'user00042@example.com', 'nomatch']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UserIndex build/update/search timings')
+    parser.add_argument('--tenant-size', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    users = duo_authenticator.shape_users(make_tenant(args.tenant_size))
+    index = UserIndex()
+    start = time.perf_counter()
+    index.rebuild(users)
+    print(f'rebuild: {len(users)} users, {sum(map(len, index.tokens.values()))} tokens in {time.perf_counter() - start:.2f}s')
+
+    # A refresh where 0.1% of users changed name, as DirectoryChanges would deliver it
+    changed = [copy.copy(user) if i % 1000 == 0 else user for i, user in enumerate(users)]
+    for user in changed[::1000]:
+        user.fullname += ' Jr'
+    start = time.perf_counter()
+    index.apply(DirectoryDelta('v2', 'v1', changed, [], [user for user in changed if user.fullname.endswith(' Jr')], []))
+    print(f'apply:   {sum(a is not b for a, b in zip(users, changed))} changed users in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results = index.search(query, 20)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f'search {query!r:26} {len(results):3} results  '
+              f'p50 {statistics.median(timings) * 1e6:8.1f}us  p95 {timings[int(len(timings) * 0.95)] * 1e6:8.1f}us  '
+              f'p99 {timings[int(len(timings) * 0.99)] * 1e6:8.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Bytes on the wire and server time for /users/: a console's first load per content coding (rendered and
+compressed once per directory version), a second console's load of the same version, and a repeat load
+with If-None-Match.
+
+Usage (from backend/):
+    python -m benchmarks.users_conditional --tenant-size 10000 100000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+import httpx
+
+from benchmarks.fake_duo import make_tenant
+from directory_cache import directory_cache
+from duo_app import duo_authenticator
+from main import create_app
+
+CODINGS = ('identity', 'gzip', 'br')
+
+
+async def load(client, coding, etag=None):
+    headers = {'Accept-Encoding': coding}
+    if etag:
+        headers['If-None-Match'] = etag
+    start = time.perf_counter()
+    async with client.stream('GET', '/users/', headers=headers) as response:
+        await response.aread()
+    # Status line and headers are roughly the same size either way; count them too
+    size = response.num_bytes_downloaded + sum(len(name) + len(value) + 4 for name, value in response.headers.raw)
+    return time.perf_counter() - start, response.status_code, size, response.headers.get('etag')
+
+
+async def run(tenant_size):
+    directory_cache.users = None
+    directory_cache.seed(duo_authenticator.shape_users(make_tenant(tenant_size)))
+    app = create_app()
+    rows = []
+    async with httpx.AsyncClient(app=app, base_url='http://helpdesk') as client:
+        for coding in CODINGS:
+            first = await load(client, coding)
+            rows.append((coding, 'first load', first))
+            rows.append((coding, 'same version', await load(client, coding)))
+            rows.append((coding, 'If-None-Match', await load(client, coding, first[3])))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/users/ conditional GET and compression')
+    parser.add_argument('--tenant-size', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    for tenant_size in args.tenant_size:
+        with contextlib.redirect_stdout(io.StringIO()):  # "Fetching users..." on every request
+            rows = asyncio.run(run(tenant_size))
+        for coding, name, (seconds, status, size, _) in rows:
+            print(f'{tenant_size:7} {coding:9} {name:14} {status}  {size:11,} bytes  {seconds * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+Several consoles opening at once on a cold cache: time to the first user and to the whole directory for
+the /users/ document vs the /users/?stream=1 NDJSON stream, and the Admin API pages they cost. The route
+is driven over ASGI directly, since httpx's ASGI transport would buffer the streamed body.
+
+Usage (from backend/):
+    python -m benchmarks.users_stream --tenant-size 2000 20000 --consoles 5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+from benchmarks.fake_duo import FakeDuoServer, create_fake_duo_app
+from config.config import config
+from directory_cache import directory_cache
+from duo_app import duo_authenticator
+from main import create_app
+
+MODES = {'document': b'', 'stream': b'stream=1'}
+
+
+async def load(app, query_string):
+    # (seconds to the first body bytes, seconds to the end, bytes) of one GET /users/
+    start = time.perf_counter()
+    first = None
+    size = 0
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()  # StreamingResponse listens for a disconnect until the body is sent
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal first, size
+        if message['type'] == 'http.response.body' and message.get('body'):
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(message['body'])
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': '/users/', 'raw_path': b'/users/', 'query_string': query_string, 'root_path': '',
+             'headers': [(b'host', b'helpdesk')], 'client': ('127.0.0.1', 50000), 'server': ('helpdesk', 80)}
+    await app(scope, receive, send)
+    finished.set()
+    return first, time.perf_counter() - start, size
+
+
+async def run(fake, consoles):
+    app = create_app()
+    results = {}
+    for mode, query_string in MODES.items():
+        directory_cache.users = None  # Cold: the consoles share one directory walk
+        before = fake.state.requests['/admin/v1/users']
+        loads = await asyncio.gather(*(load(app, query_string) for _ in range(consoles)))
+        results[mode] = loads, fake.state.requests['/admin/v1/users'] - before
+    await directory_cache.shutdown()
+    await duo_authenticator.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold /users/: whole document vs NDJSON stream')
+    parser.add_argument('--tenant-size', type=int, nargs='+', default=[2000, 20000])
+    parser.add_argument('--consoles', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the fake Admin API takes per page')
+    args = parser.parse_args()
+
+    print(f"{'tenant':>6} {'mode':9} {'first user ms':>14} {'complete ms':>12} {'MB each':>8} {'Admin pages':>12}")
+    for tenant_size in args.tenant_size:
+        fake = create_fake_duo_app(tenant_size=tenant_size, latency=args.latency)
+        with FakeDuoServer(fake) as server:
+            duo_authenticator.configure(config.model_copy(update=server.settings_overrides()))
+            with contextlib.redirect_stdout(io.StringIO()):  # "Fetching users..." on every request
+                results = asyncio.run(run(fake, args.consoles))
+        for mode, (loads, pages) in results.items():
+            first = statistics.median(first for first, _, _ in loads)
+            complete = statistics.median(complete for _, complete, _ in loads)
+            print(f'{tenant_size:6} {mode:9} {first * 1000:14.0f} {complete * 1000:12.0f} '
+                  f'{loads[0][2] / 1e6:8.2f} {pages:12}')
+
+
+if __name__ == '__main__':
+    main()
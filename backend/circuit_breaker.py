@@ -0,0 +1,98 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of calls to one host over the last window seconds. Once at least min_calls were
+    made and failure_ratio of them failed, the circuit opens and calls are refused for cooldown seconds.
+    Then a single trial call is let through (half open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, failure_ratio, min_calls, window, cooldown):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.outcomes = deque()  # (monotonic time, failed) within the window
+        self.failures = 0  # Failed entries in outcomes
+        self.opened_at = None
+        self._trial_running = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0.0)
+
+    def allow(self):
+        """
+        Whether a call may go out now. Every allowed call must end with record() or release().
+        """
+        if self.state == OPEN and self.retry_after <= 0:
+            self.state = HALF_OPEN
+        if self.state == OPEN or (self.state == HALF_OPEN and self._trial_running):
+            self.rejected += 1
+            return False
+        if self.state == HALF_OPEN:
+            self._trial_running = True
+        return True
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.outcomes.clear()
+        self.failures = 0
+
+    def record(self, failed):
+        if self.state == OPEN:
+            return  # A call that started before the circuit opened
+        if self.state == HALF_OPEN:
+            self._trial_running = False
+            if failed:
+                self._open()
+            else:
+                self.state = CLOSED
+            return
+        now = time.monotonic()
+        self.outcomes.append((now, failed))
+        self.failures += failed
+        while self.outcomes and now - self.outcomes[0][0] > self.window:
+            self.failures -= self.outcomes.popleft()[1]
+        if self.state == CLOSED and len(self.outcomes) >= self.min_calls \
+                and self.failures >= self.failure_ratio * len(self.outcomes):
+            self._open()
+
+    def release(self):
+        # The call was abandoned (e.g. cancelled) before it had an outcome
+        if self.state == HALF_OPEN:
+            self._trial_running = False
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'retry_after': round(self.retry_after, 3),
+            'calls': len(self.outcomes),
+            'failures': self.failures,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+        }
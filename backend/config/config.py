@@ -13,7 +13,7 @@ or implied.
 
 import pathlib
 import re
-from typing import Optional, ClassVar
+from typing import Dict, List, Literal, Optional, ClassVar
 from dotenv import load_dotenv
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
@@ -37,6 +37,18 @@ class Config(BaseSettings):
     APP_NAME: Optional[str] = 'Add an app name in .env'
     LOGGER_LEVEL: Optional[str] = 'DEBUG'
 
+    # Logging (see logrr.py)
+    LOG_MODE: Literal['dev', 'production'] = 'dev'  # dev: Rich console and a text log; production: bounded queue, batched JSON lines, no Rich
+    LOG_FILE: str = 'logs/app.log'  # dev: appended to by every worker; production 'file' output: logs/app.<pid>.log per worker
+    LOG_PRODUCTION_OUTPUT: Literal['stdout', 'file'] = 'stdout'  # Production: JSON lines to stdout (e.g. docker logs) or to rotated files
+    LOG_FILE_MAX_BYTES: int = 50 * 1024 * 1024  # Production 'file' output: size rotation, unless LOG_FILE_ROTATE_WHEN is set
+    LOG_FILE_ROTATE_WHEN: Optional[str] = None  # Time rotation instead, e.g. 'midnight' or 'H' (see TimedRotatingFileHandler)
+    LOG_FILE_BACKUPS: int = 5
+    LOG_QUEUE_SIZE: int = 10000  # Production: records waiting for the writer before new ones are shed
+    LOG_QUEUE_POLICY: Literal['drop', 'sample'] = 'sample'  # Production: shed records only when full, or also sample DEBUG/INFO once half full
+    LOG_SAMPLE_RATE: int = 10  # Keep 1 in this many DEBUG/INFO records while sampling
+    LOG_BATCH_SIZE: int = 500  # Production: records per file write
+
     # Backend
     DUO_API_URL: str
     DUO_IKEY: str
@@ -46,6 +58,64 @@ class Config(BaseSettings):
     DUO_ADMIN_IKEY: str
     DUO_ADMIN_SKEY: str
 
+    # Optional CA bundle for verifying the Duo API hosts (e.g. behind a TLS-inspecting proxy)
+    DUO_CA_BUNDLE: Optional[str] = None
+
+    # Outbound HTTP to Duo (one pool per Auth/Admin host)
+    DUO_HTTP_POOL_SIZE: int = 10
+    DUO_HTTP_CONNECT_TIMEOUT: float = 5.0
+    DUO_HTTP_READ_TIMEOUT: float = 30.0  # Unless overridden per endpoint below
+    # Read deadline per Duo API path; auth_status needs room for Duo to long-poll
+    DUO_ENDPOINT_READ_TIMEOUTS: Dict[str, float] = {
+        '/auth/v2/preauth': 5.0,
+        '/auth/v2/auth': 10.0,
+        '/auth/v2/auth_status': 35.0,
+        '/admin/v1/users': 20.0,
+    }
+    DUO_HTTP_STATUS_POOL_SIZE: int = 100  # Separate pool for auth_status, which Duo may hold open per pending push
+    DUO_HTTP_RETRIES: int = 2  # Retries of failed connection attempts
+    DUO_ADMIN_SYNC_CONCURRENCY: int = 4  # Parallel /admin/v1/users page fetches; 1 walks pages serially
+
+    # Outbound rate limiting per Duo host; 429 responses are retried with jittered exponential backoff
+    DUO_RATE_LIMIT_PER_SECOND: float = 50.0  # 0 disables the token bucket
+    DUO_RATE_LIMIT_BURST: int = 100
+    DUO_RATE_LIMIT_RETRIES: int = 4
+    DUO_RATE_LIMIT_BACKOFF: float = 1.0  # Seconds before the first retry (doubled per attempt, jittered)
+    DUO_RATE_LIMIT_MAX_BACKOFF: float = 30.0
+
+    # Circuit breaker per Duo host (see circuit_breaker.py): fail fast while Duo is failing
+    DUO_BREAKER_FAILURE_RATIO: float = 0.5  # Share of failed calls (errors, timeouts, 5xx) that opens the circuit
+    DUO_BREAKER_MIN_CALLS: int = 10  # Calls in the window before the ratio counts
+    DUO_BREAKER_WINDOW: float = 30.0  # Seconds of history
+    DUO_BREAKER_COOLDOWN: float = 15.0  # Seconds the circuit stays open before a trial call
+    # Hedged reads: repeat an idempotent call still unanswered after this many seconds, keep the first answer
+    DUO_HEDGE_DELAY: float = 0.0  # 0 disables hedging
+    DUO_HEDGE_PATHS: List[str] = ['/admin/v1/users', '/auth/v2/auth_status']  # Drop auth_status if Duo long-polls it
+
+    # Pending push transactions (see push_registry.py)
+    PUSH_REGISTRY_MAX_SIZE: int = 1000
+    PUSH_RESULT_TTL: int = 300  # Seconds a push result stays available to /push/{txid}
+    PUSH_BATCH_CONCURRENCY: int = 200  # Pushes /push/batch keeps waiting on at once
+    PUSH_BATCH_MAX_SIZE: int = 500  # Users per /push/batch request
+    PUSH_STATUS_TIMEOUT: float = 60.0  # Seconds to wait for the user to answer a push
+    # /auth/v2/auth_status polling: fast right after the push, backing off while the user takes their time
+    PUSH_STATUS_POLL_MIN_INTERVAL: float = 0.25
+    PUSH_STATUS_POLL_MAX_INTERVAL: float = 2.0
+    PUSH_STATUS_POLL_BACKOFF: float = 1.5
+
+    # Per-user /auth/v2/preauth results (see preauth_cache.py)
+    PREAUTH_ENABLED: bool = True  # Check users before /push/ and /token/ and push to a specific device
+    PREAUTH_CACHE_TTL: int = 60
+    PREAUTH_CACHE_MAX_SIZE: int = 1000
+
+    # User directory cache (see directory_cache.py)
+    USERS_CACHE_TTL: int = 300  # Seconds before a background refresh of /users/
+    USERS_CHANGES_HISTORY: int = 100  # Directory versions /users/changes can still diff against
+    USERS_SNAPSHOT_PATH: Optional[str] = str(DIR_PATH.parent / 'data' / 'users.sqlite3')  # Empty disables the on-disk snapshot
+    # Uvicorn workers sharing USERS_SNAPSHOT_PATH elect one to sync with Duo; the others reload its snapshots (see directory_shared.py)
+    USERS_SHARED: bool = True
+    USERS_SHARED_POLL_INTERVAL: float = 2.0  # Seconds between a follower's checks for a newer snapshot or a vacant leader lock
+
     @field_validator('DUO_API_URL', mode='before')
     def validate_duo_api_url(cls, v):
         if not re.match(r'https://api-16b8c3ed\.duosecurity\.com', v):
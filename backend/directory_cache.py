@@ -0,0 +1,191 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+import time
+from config.config import config
+from logrr import logger_manager
+from duo_app import duo_authenticator
+from metrics import DIRECTORY_USERS, DIRECTORY_SYNC_DURATION, child
+
+
+class DirectoryWalk:
+    """
+    The users a running refresh has fetched so far, so streaming clients can follow it page by page
+    instead of waiting for the whole directory.
+    """
+
+    def __init__(self):
+        self.users = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def add(self, page):
+        self.users.extend(page)
+        self._wake()
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    async def follow(self):
+        """
+        Yield the users fetched so far, then every page as it lands, until the refresh ends.
+        """
+        sent = 0
+        while True:
+            changed = self._changed
+            if sent < len(self.users):
+                page = self.users[sent:]
+                sent += len(page)
+                yield page
+            elif self.done:
+                return
+            else:
+                await changed.wait()
+
+
+class DirectoryCache:
+    """
+    In-process cache of the shaped user directory with stale-while-revalidate semantics.
+    Once a snapshot exists it is always served immediately; when it is older than ttl a single
+    background refresh replaces it. Only the very first load makes callers wait.
+    """
+
+    def __init__(self, fetch, ttl=config.USERS_CACHE_TTL):
+        self.fetch = fetch  # Coroutine function of an on_page callback returning the user list (or a Duo error response)
+        self.ttl = ttl
+        self.users = None
+        self.fetched_at = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._refresh_task = None
+        self.walk = None  # DirectoryWalk of the latest refresh
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Call listener(users) whenever a new snapshot is installed, e.g. to rebuild derived indexes.
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, users):
+        for listener in self.listeners:
+            try:
+                listener(users)
+            except Exception as e:
+                logger_manager.logger.error(f"User directory listener {listener} failed: {e}")
+
+    @property
+    def age(self):
+        if self.fetched_at is None:
+            return None
+        return time.monotonic() - self.fetched_at
+
+    def seed(self, users, age=0.0):
+        """
+        Install a snapshot obtained elsewhere (e.g. from disk) that is already age seconds old.
+        Ignored once the cache holds data from Duo.
+        """
+        if self.users is not None:
+            return
+        self.users = users
+        self.fetched_at = time.monotonic() - age
+        self._notify(users)
+
+    @property
+    def stale(self):
+        return self.users is None or self.age > self.ttl
+
+    @property
+    def refreshing(self):
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    def refresh(self):
+        # At most one refresh runs at a time; everyone else shares its task
+        if self._refresh_task is None or self._refresh_task.done():
+            self.walk = DirectoryWalk()
+            self._refresh_task = asyncio.create_task(self._do_refresh(self.walk))
+            # Background refreshes may have no awaiter; the failure is already logged
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh_task
+
+    async def _do_refresh(self, walk):
+        start = time.monotonic()
+        try:
+            result = await self.fetch(walk.add)
+        except Exception as e:
+            self.refresh_errors += 1
+            child(DIRECTORY_SYNC_DURATION, 'error').observe(time.monotonic() - start)
+            logger_manager.logger.error(f"User directory refresh failed: {e}")
+            raise
+        finally:
+            walk.finish()
+        if not isinstance(result, list):
+            # Duo returned an error response; keep serving the previous snapshot
+            self.refresh_errors += 1
+            child(DIRECTORY_SYNC_DURATION, 'error').observe(time.monotonic() - start)
+            logger_manager.logger.error(f"User directory refresh failed: {result}")
+            return result
+        self.users = result
+        self.fetched_at = time.monotonic()
+        self.refreshes += 1
+        child(DIRECTORY_SYNC_DURATION, 'ok').observe(self.fetched_at - start)
+        self._notify(result)
+        logger_manager.logger.info(f"User directory refreshed: {len(result)} users in {self.fetched_at - start:.2f}s")
+        return result
+
+    def cached(self):
+        """
+        The snapshot to serve right away (refreshed in the background when stale), or None while the cache is cold.
+        """
+        if self.users is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.stale:
+            self.refresh()
+        return self.users
+
+    async def get(self):
+        users = self.cached()
+        if users is None:
+            return await asyncio.shield(self.refresh())  # A disconnecting caller must not cancel the shared refresh
+        return users
+
+    def stats(self):
+        return {
+            'size': len(self.users) if self.users is not None else 0,
+            'age': self.age,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'refreshing': self.refreshing,
+        }
+
+    async def shutdown(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+
+
+directory_cache = DirectoryCache(duo_authenticator.fetch_users)  # Create a single instance of DirectoryCache
+DIRECTORY_USERS.set_function(lambda: len(directory_cache.users or ()))
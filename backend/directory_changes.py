@@ -0,0 +1,137 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import hashlib
+import itertools
+from collections import deque
+from config.config import config
+from logrr import logger_manager
+from directory_cache import directory_cache
+
+
+def user_hash(user):
+    # A DirectoryUser's JSON always lists its fields in the same order, so it is a canonical encoding
+    return hashlib.blake2b(user.to_json().encode(), digest_size=16).digest()
+
+
+class DirectoryDelta:
+    __slots__ = ('version', 'previous', 'users', 'added', 'changed', 'removed')
+
+    def __init__(self, version, previous, users, added, changed, removed):
+        self.version = version
+        self.previous = previous  # The version this delta applies to (None for the first directory)
+        self.users = users  # The full list this delta leads to (only while listeners run)
+        self.added = added  # DirectoryUsers
+        self.changed = changed  # DirectoryUsers
+        self.removed = removed  # Usernames
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+
+class DirectoryChanges:
+    """
+    Turns successive directory snapshots into deltas using a content hash per user, and keeps the
+    last history deltas so clients can catch up from the version they hold. A version is the content
+    digest of the whole directory, so every worker (and a restarted one) that holds the same directory
+    hands out and accepts the same cursor; a cursor this worker never held gets a full reset instead.
+    """
+
+    def __init__(self, history=config.USERS_CHANGES_HISTORY):
+        self.hashes = {}  # username -> content hash of the shaped user
+        self.users = []
+        self.digest = None  # Content hash of the whole directory in order, the same in every worker
+        self.log = deque(maxlen=history)
+        self.listeners = []
+
+    @property
+    def cursor(self):
+        return self.digest
+
+    def add_listener(self, listener):
+        """
+        Call listener(delta) for every new version, e.g. to patch derived indexes.
+        """
+        self.listeners.append(listener)
+
+    def update(self, users):
+        """
+        DirectoryCache listener: diff users against the previous snapshot and record a new version if anything changed.
+        """
+        hashes = {}
+        added = []
+        changed = []
+        for user in users:
+            username = user.username
+            digest = hashes[username] = user_hash(user)
+            previous = self.hashes.get(username)
+            if previous is None:
+                added.append(user)
+            elif previous != digest:
+                changed.append(user)
+        removed = [username for username in self.hashes if username not in hashes]
+        self.hashes = hashes
+        self.users = users
+        previous_version, self.digest = self.digest, hashlib.blake2b(b''.join(hashes.values()), digest_size=16).hexdigest()
+        if self.digest == previous_version:
+            return
+        # Recorded even when only the order changed, so every version this worker held stays a valid cursor
+        delta = DirectoryDelta(self.digest, previous_version, users, added, changed, removed)
+        self.log.append(delta)
+        logger_manager.logger.info(f"User directory version {self.cursor}: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+        for listener in self.listeners:
+            try:
+                listener(delta)
+            except Exception as e:
+                logger_manager.logger.error(f"User directory changes listener {listener} failed: {e}")
+        delta.users = None  # Don't keep a full copy of the directory per logged version
+
+    def since(self, cursor):
+        """
+        What changed after cursor, merged into one delta. Unknown or expired cursors get
+        reset=True with the whole directory in added.
+        """
+        start = None
+        if cursor and cursor == self.digest:
+            start = len(self.log)
+        elif cursor:
+            # The latest delta leaving that version: a directory that changed back replays the shortest way
+            start = next((i for i in range(len(self.log) - 1, -1, -1) if self.log[i].previous == cursor), None)
+        if start is None:
+            return {'version': self.cursor, 'reset': True, 'added': self.users, 'changed': [], 'removed': []}
+
+        # Replay the deltas per user: what the client had at cursor vs. the latest state
+        had = {}  # username -> present at cursor
+        latest = {}  # username -> user, or None once removed
+        for delta in itertools.islice(self.log, start, None):
+            for user in delta.added:
+                had.setdefault(user.username, False)
+                latest[user.username] = user
+            for user in delta.changed:
+                had.setdefault(user.username, True)
+                latest[user.username] = user
+            for username in delta.removed:
+                had.setdefault(username, True)
+                latest[username] = None
+        result = {'version': self.cursor, 'reset': False, 'added': [], 'changed': [], 'removed': []}
+        for username, user in latest.items():
+            if user is None:
+                if had[username]:
+                    result['removed'].append(username)
+            else:
+                result['changed' if had[username] else 'added'].append(user)
+        return result
+
+
+directory_changes = DirectoryChanges()  # Create a single instance of DirectoryChanges
+directory_cache.add_listener(directory_changes.update)  # Diff every new directory snapshot
@@ -0,0 +1,114 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+import gzip
+import brotli
+from fastapi.responses import Response
+from directory_store import dumps
+
+CODINGS = ('br', 'gzip')  # In order of preference
+MIN_COMPRESS_SIZE = 1024  # Smaller bodies go out uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Higher qualities take seconds on a large directory for a few percent less
+
+
+def accepted_codings(header):
+    """
+    (accepted, refused): the content codings an Accept-Encoding header allows, and those it refuses with q=0
+    (which "*" must not bring back).
+    """
+    accepted = set()
+    refused = set()
+    for item in (header or '').split(','):
+        coding, *params = item.split(';')
+        weight = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    pass
+        coding = coding.strip().lower()
+        if coding:
+            (accepted if weight > 0 else refused).add(coding)
+    return accepted, refused
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match compares weakly, so a W/ prefix added by a proxy still matches
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+class DirectoryResponses:
+    """
+    /users/ bodies for the current directory version, rendered and compressed at most once per content
+    coding on a worker thread, and 304 Not Modified for clients that already hold that version.
+    Each coding has its own strong ETag (the bytes differ), derived from the directory's content digest,
+    so every worker gives the same version the same tag.
+    """
+
+    def __init__(self):
+        self.digest = None
+        self.bodies = {}  # coding -> future of (coding sent, body) for self.digest
+        self.renders = 0
+        self.not_modified = 0
+
+    def _render(self, users, coding):
+        self.renders += 1
+        body = dumps({"output": users}).encode()
+        if len(body) < MIN_COMPRESS_SIZE:
+            return 'identity', body
+        if coding == 'br':
+            return coding, brotli.compress(body, quality=BROTLI_QUALITY)
+        if coding == 'gzip':
+            return coding, gzip.compress(body, GZIP_LEVEL)
+        return 'identity', body
+
+    async def respond(self, request, users, digest):
+        """
+        The response for users, the directory whose DirectoryChanges digest is digest.
+        """
+        accepted, refused = accepted_codings(request.headers.get('accept-encoding'))
+        coding = next((c for c in CODINGS if c in accepted or ('*' in accepted and c not in refused)), 'identity')
+        etag = f'"{digest}"' if coding == 'identity' else f'"{digest}-{coding}"'
+        headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}  # no-cache: revalidate every time
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if digest != self.digest:
+            self.digest = digest
+            self.bodies = {}
+        body = self.bodies.get(coding)
+        if body is None:
+            body = self.bodies[coding] = asyncio.get_running_loop().run_in_executor(None, self._render, users, coding)
+        try:
+            sent, content = await asyncio.shield(body)  # A disconnecting client must not cancel the shared render
+        except Exception:
+            if self.bodies.get(coding) is body:
+                del self.bodies[coding]
+            raise
+        if sent != 'identity':
+            headers['Content-Encoding'] = sent
+        return Response(content=content, media_type='application/json', headers=headers)
+
+    def stats(self):
+        return {'digest': self.digest, 'cached': sorted(self.bodies), 'renders': self.renders, 'not_modified': self.not_modified}
+
+
+directory_responses = DirectoryResponses()  # Create a single instance of DirectoryResponses
@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+import os
+import time
+from config.config import config
+from logrr import logger_manager
+from directory_cache import directory_cache
+from directory_snapshot import directory_snapshot
+
+try:
+    import fcntl
+except ImportError:  # No flock (Windows): every process syncs on its own
+    fcntl = None
+
+FAILED_SYNC_RETRY = 30  # Most seconds before the leader retries a failed background sync
+
+
+class SharedDirectory:
+    """
+    Lets the worker processes of one host share a single directory sync through the on-disk snapshot.
+    Workers race for an exclusive flock next to the snapshot file: the winner (leader) walks the Admin API
+    as before and saves every refresh to the snapshot, while the others (followers) never fetch users
+    from Duo and reload the snapshot whenever the leader has replaced it. The lock is released when the
+    leader exits, and the next follower to find it vacant takes over.
+    """
+
+    def __init__(self, cache, snapshot, enabled=config.USERS_SHARED, poll_interval=config.USERS_SHARED_POLL_INTERVAL):
+        self.cache = cache
+        self.snapshot = snapshot
+        self.sync = cache.fetch  # The directory walk, used while leading
+        self.enabled = enabled and snapshot.path is not None and fcntl is not None
+        self.poll_interval = poll_interval
+        self.leader = not self.enabled
+        self.loaded_version = None  # Version of the snapshot this worker installed last
+        self.reloads = 0
+        self._lock_file = None
+        self._last_sync = None
+        self._task = None
+
+    def snapshot_version(self):
+        # The snapshot is replaced by rename, so a new inode or mtime means the leader saved a new one
+        try:
+            stat = os.stat(self.snapshot.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def try_lead(self):
+        if self.leader:
+            return True
+        if self._lock_file is None:
+            self.snapshot.path.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(self.snapshot.path.with_name(self.snapshot.path.name + '.lock'), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.leader = True
+        self.cache.fetch = self.sync
+        logger_manager.logger.info(f"Worker {os.getpid()} syncs the user directory for all workers")
+        return True
+
+    def start(self):
+        """
+        Elect this worker or make it follow the leader. Call after seeding the cache from the snapshot
+        and before its first refresh.
+        """
+        if not self.enabled:
+            return
+        if self.cache.users is not None and self.cache.users is self.snapshot.loaded:
+            self.loaded_version = self.snapshot_version()
+        if not self.try_lead():
+            self.cache.fetch = self.fetch_from_leader
+        self._task = asyncio.create_task(self._run())
+
+    async def fetch_from_leader(self, on_page=None):
+        """
+        DirectoryCache.fetch while following: the leader's next snapshot instead of a walk of the Admin API.
+        The snapshot arrives whole, so on_page is only used after taking over.
+        """
+        deadline = time.monotonic() + self.cache.ttl
+        while not self.leader:
+            version = self.snapshot_version()
+            if version is not None and version != self.loaded_version:
+                loaded = await asyncio.get_running_loop().run_in_executor(None, self.snapshot.load)
+                if loaded is not None:
+                    self.loaded_version = version
+                    self.reloads += 1
+                    return loaded[0]
+            if time.monotonic() >= deadline:
+                return {'stat': 'FAIL', 'message': 'The syncing worker saved no new user directory'}
+            await asyncio.sleep(self.poll_interval)
+        return await self.sync(on_page)  # Took over while waiting
+
+    def _tick(self):
+        if self.try_lead():
+            # Keep the shared snapshot fresh even when this worker gets no /users/ traffic
+            now = time.monotonic()
+            retry_due = self._last_sync is None or now - self._last_sync >= min(FAILED_SYNC_RETRY, self.cache.ttl)
+            if self.cache.stale and not self.cache.refreshing and retry_due:
+                self._last_sync = now
+                self.cache.refresh()
+        elif self.snapshot_version() not in (None, self.loaded_version) and not self.cache.refreshing:
+            self.cache.refresh()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self._tick()
+            except Exception as e:
+                logger_manager.logger.error(f"Shared user directory check failed: {e}")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'role': 'leader' if self.leader else 'follower',
+            'pid': os.getpid(),
+            'reloads': self.reloads,
+        }
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the lock for the next leader
+            self._lock_file = None
+        if self.enabled:
+            self.leader = False
+            self.cache.fetch = self.sync
+
+
+shared_directory = SharedDirectory(directory_cache, directory_snapshot)  # Create a single instance of SharedDirectory
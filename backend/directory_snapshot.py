@@ -0,0 +1,116 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from config.config import config
+from logrr import logger_manager
+from directory_cache import directory_cache
+from directory_store import DirectoryUser, dumps
+
+SCHEMA_VERSION = 1  # Bump whenever the shape of the stored users changes
+
+
+def load_users_without_gc(data):
+    # Decoding builds a huge graph of fresh objects, which keeps triggering pointless cyclic GC passes
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [DirectoryUser.from_dict(user) for user in json.loads(data)]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+class DirectorySnapshot:
+    """
+    The last fetched user directory, persisted as a single SQLite file so a restart can serve
+    /users/ immediately. The users are stored as one zlib-compressed JSON blob next to a small
+    meta table (schema version, save time, user count); files with another schema version are ignored.
+    """
+
+    def __init__(self, path=config.USERS_SNAPSHOT_PATH):
+        self.path = pathlib.Path(path) if path else None
+        self.loaded = None  # The list returned by load(), so seeding the cache doesn't re-save it
+        self._lock = threading.Lock()
+
+    def save(self, users):
+        # Written to a temporary file of this writer's own and renamed into place, so readers never see a
+        # partial snapshot and workers saving at the same time don't clobber each other's file
+        payload = zlib.compress(dumps(users).encode(), 1)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=self.path.name + '.', suffix='.tmp', dir=self.path.parent)
+            os.close(fd)  # SQLite creates its database in the empty file
+            try:
+                with contextlib.closing(sqlite3.connect(tmp_path)) as db:
+                    db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value)')
+                    db.execute('CREATE TABLE snapshot (id INTEGER PRIMARY KEY, users BLOB NOT NULL)')
+                    db.executemany('INSERT INTO meta VALUES (?, ?)', [
+                        ('schema_version', SCHEMA_VERSION), ('saved_at', time.time()), ('count', len(users)),
+                    ])
+                    db.execute('INSERT INTO snapshot VALUES (1, ?)', (payload,))
+                    db.commit()
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def _save_logged(self, users):
+        try:
+            start = time.monotonic()
+            self.save(users)
+            logger_manager.logger.info(f"Saved user directory snapshot ({len(users)} users) in {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            logger_manager.logger.error(f"Saving user directory snapshot to {self.path} failed: {e}")
+
+    def save_in_background(self, users):
+        """
+        DirectoryCache listener: write the snapshot on a worker thread so the event loop keeps serving.
+        """
+        if self.path is None or users is self.loaded:
+            return
+        asyncio.get_running_loop().run_in_executor(None, self._save_logged, users)
+
+    def load(self):
+        """
+        Returns (users, age in seconds), or None when there is no usable snapshot.
+        """
+        if self.path is None or not self.path.exists():
+            return None
+        try:
+            with contextlib.closing(sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)) as db:
+                meta = dict(db.execute('SELECT key, value FROM meta'))
+                if meta.get('schema_version') != SCHEMA_VERSION:
+                    logger_manager.logger.warning(f"Ignoring user directory snapshot with schema version {meta.get('schema_version')}")
+                    return None
+                (payload,) = db.execute('SELECT users FROM snapshot WHERE id = 1').fetchone()
+            users = load_users_without_gc(zlib.decompress(payload))
+        except (sqlite3.Error, zlib.error, ValueError, TypeError, KeyError) as e:
+            logger_manager.logger.warning(f"Ignoring unreadable user directory snapshot {self.path}: {e}")
+            return None
+        self.loaded = users
+        return users, max(time.time() - meta['saved_at'], 0.0)
+
+
+directory_snapshot = DirectorySnapshot()  # Create a single instance of DirectorySnapshot
+directory_cache.add_listener(directory_snapshot.save_in_background)  # Persist every refreshed directory
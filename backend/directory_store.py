@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import json
+import sys
+from json.encoder import encode_basestring
+
+CAPABILITIES = {}  # capabilities tuple -> (the one shared tuple, its JSON)
+
+
+def json_str(value):
+    return 'null' if value is None else encode_basestring(value)
+
+
+def intern_capabilities(capabilities):
+    """
+    The shared tuple for a set of device capabilities; a tenant only has a handful of distinct ones.
+    """
+    key = tuple(capabilities)
+    entry = CAPABILITIES.get(key)
+    if entry is None:
+        entry = CAPABILITIES[key] = (key, json.dumps(key, separators=(',', ':')))
+    return entry[0]
+
+
+def intern_str(value):
+    return None if value is None else sys.intern(value)
+
+
+class DirectoryDevice:
+    __slots__ = ('id', 'type', 'capabilities', 'model', 'number')
+
+    def __init__(self, id, type, capabilities, model=None, number=None):
+        self.id = id
+        self.type = intern_str(type)
+        self.capabilities = intern_capabilities(capabilities)
+        self.model = intern_str(model)  # Few distinct models per tenant
+        self.number = number
+
+    def __eq__(self, other):
+        return isinstance(other, DirectoryDevice) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def to_json(self):
+        return (f'{{"id":{json_str(self.id)},"type":{json_str(self.type)},"capabilities":{CAPABILITIES[self.capabilities][1]},'
+                f'"model":{json_str(self.model)},"number":{json_str(self.number)}}}')
+
+    def to_dict(self):
+        return {'id': self.id, 'type': self.type, 'capabilities': list(self.capabilities), 'model': self.model, 'number': self.number}
+
+
+class DirectoryUser:
+    """
+    One shaped directory user. Replaces the per-user dict (and per-device dicts and capability lists)
+    with slotted records sharing interned strings, and writes its JSON straight from the slots;
+    the JSON has the same keys, in the same order, as the dicts it replaces.
+    """
+    __slots__ = ('username', 'fullname', 'email', 'status', 'devices')
+
+    def __init__(self, username, fullname, email, status, devices=()):
+        self.username = username
+        self.fullname = fullname
+        self.email = email
+        self.status = intern_str(status)
+        self.devices = tuple(devices)
+
+    @classmethod
+    def from_dict(cls, user):
+        return cls(user['username'], user['fullname'], user['email'], user['status'],
+                   [DirectoryDevice(**device) for device in user['devices']])
+
+    def __eq__(self, other):
+        return isinstance(other, DirectoryUser) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def to_json(self):
+        return (f'{{"username":{json_str(self.username)},"fullname":{json_str(self.fullname)},"email":{json_str(self.email)},'
+                f'"status":{json_str(self.status)},"devices":[{",".join([device.to_json() for device in self.devices])}]}}')
+
+    def to_dict(self):
+        return {'username': self.username, 'fullname': self.fullname, 'email': self.email, 'status': self.status,
+                'devices': [device.to_dict() for device in self.devices]}
+
+
+def dumps(value):
+    """
+    Compact JSON for value, which may contain DirectoryUsers anywhere among dicts, lists and scalars.
+    Directory users are written from their slots, never converted to dicts first.
+    """
+    if isinstance(value, DirectoryUser):
+        return value.to_json()
+    if isinstance(value, dict):
+        return '{' + ','.join([f'{encode_basestring(str(key))}:{dumps(item)}' for key, item in value.items()]) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join([dumps(item) for item in value]) + ']'
+    return json.dumps(value, ensure_ascii=False)
@@ -12,30 +12,99 @@ or implied.
 """
 
 import sys
+import asyncio
+import collections
+import itertools
 import base64
 import email.utils
 import hmac
 import hashlib
 import urllib.parse
-import requests
+import httpx
 from urllib.parse import urlparse
 from config.config import config
+from duo_scheduler import DuoScheduler, INTERACTIVE, BACKGROUND
+from single_flight import SingleFlight
+from circuit_breaker import CircuitBreaker
+from directory_store import DirectoryUser, DirectoryDevice
+from metrics import DUO_REQUEST_DURATION, child
+from logrr import logger_manager
 import time
-from pprint import pprint
+
+USERS_PAGE_SIZE = 100  # Users per /admin/v1/users page
+
+
+class DuoAPIError(Exception):
+    """
+    Duo answered with stat != OK; the full response is kept on .response.
+    """
+
+    def __init__(self, response):
+        super().__init__(response.get('message_detail') or response.get('message') or str(response))
+        self.response = response
+
+
+class DuoUnavailableError(DuoAPIError):
+    """
+    The circuit breaker for a Duo host is open, so the call was refused without being sent.
+    """
+
+    def __init__(self, host, retry_after):
+        super().__init__({'stat': 'FAIL', 'code': 503, 'message': 'Duo API unavailable',
+                          'message_detail': f'Recent calls to {host} failed; retrying in {retry_after:.0f}s'})
+        self.retry_after = retry_after
 
 
 class DuoAuthenticator:
-    def __init__(self):
+    def __init__(self, settings=config):
+        self._clients = {}
+        # Identical concurrent calls share one Duo request: keyed by (operation, username, ...) or ('fetch_users',)
+        self.single_flight = SingleFlight()
+        self.configure(settings)
+
+    def configure(self, settings):
+        """
+        (Re)read the Duo settings. Call before the first request, e.g. to point the shared
+        instance at a fake Duo server.
+        """
         # Access environment variables
         # For both Auth and Admin Duo API
-        self.auth_ikey = config.DUO_IKEY
-        self.auth_skey = config.DUO_SKEY
-        self.auth_api_url = config.DUO_API_URL
+        self.auth_ikey = settings.DUO_IKEY
+        self.auth_skey = settings.DUO_SKEY
+        self.auth_api_url = settings.DUO_API_URL
         self.auth_host = self.parse_hostname(self.auth_api_url)
-        self.admin_ikey = config.DUO_ADMIN_IKEY
-        self.admin_skey = config.DUO_ADMIN_SKEY
-        self.admin_api_url = config.DUO_ADMIN_API_URL
+        self.admin_ikey = settings.DUO_ADMIN_IKEY
+        self.admin_skey = settings.DUO_ADMIN_SKEY
+        self.admin_api_url = settings.DUO_ADMIN_API_URL
         self.admin_host = self.parse_hostname(self.admin_api_url)
+        # Keep-alive connection pools (see _client_for), so requests reuse TCP+TLS sessions
+        self.verify = settings.DUO_CA_BUNDLE or True
+        self.limits = httpx.Limits(max_connections=settings.DUO_HTTP_POOL_SIZE,
+                                   max_keepalive_connections=settings.DUO_HTTP_POOL_SIZE)
+        self.status_limits = httpx.Limits(max_connections=settings.DUO_HTTP_STATUS_POOL_SIZE,
+                                          max_keepalive_connections=settings.DUO_HTTP_STATUS_POOL_SIZE)
+        self.timeout = httpx.Timeout(settings.DUO_HTTP_READ_TIMEOUT, connect=settings.DUO_HTTP_CONNECT_TIMEOUT)
+        self.endpoint_timeouts = {
+            path: httpx.Timeout(read, connect=settings.DUO_HTTP_CONNECT_TIMEOUT)
+            for path, read in settings.DUO_ENDPOINT_READ_TIMEOUTS.items()
+        }
+        self.retries = settings.DUO_HTTP_RETRIES
+        self.sync_concurrency = settings.DUO_ADMIN_SYNC_CONCURRENCY
+        self.scheduler = DuoScheduler(settings.DUO_RATE_LIMIT_PER_SECOND, settings.DUO_RATE_LIMIT_BURST,
+                                      settings.DUO_RATE_LIMIT_RETRIES, settings.DUO_RATE_LIMIT_BACKOFF,
+                                      settings.DUO_RATE_LIMIT_MAX_BACKOFF)
+        self.breaker_settings = (settings.DUO_BREAKER_FAILURE_RATIO, settings.DUO_BREAKER_MIN_CALLS,
+                                 settings.DUO_BREAKER_WINDOW, settings.DUO_BREAKER_COOLDOWN)
+        self.breakers = {}  # host -> CircuitBreaker
+        self.hedge_delay = settings.DUO_HEDGE_DELAY
+        self.hedge_paths = set(settings.DUO_HEDGE_PATHS)
+        self.hedges = 0  # Hedged requests sent
+        self.hedge_wins = 0  # Hedged requests that answered first
+        self.status_timeout = settings.PUSH_STATUS_TIMEOUT
+        self.poll_min_interval = settings.PUSH_STATUS_POLL_MIN_INTERVAL
+        self.poll_max_interval = settings.PUSH_STATUS_POLL_MAX_INTERVAL
+        self.poll_backoff = settings.PUSH_STATUS_POLL_BACKOFF
+        self._clients = {}
 
     def parse_hostname(self, url):
         parsed_url = urlparse(url)
@@ -43,8 +112,40 @@ class DuoAuthenticator:
         if not host:
             print("Error: Unable to parse hostname from API_URL.")
             sys.exit(1)
+        if parsed_url.port:
+            host = f'{host}:{parsed_url.port}'
         return host
 
+    def _client_for(self, api, host, limits=None):
+        # Created on first use so it binds to the running event loop. Auth and Admin get separate
+        # pools even when they share a host, so a directory sync can't tie up connections pushes need.
+        client = self._clients.get(api)
+        if client is None:
+            # Transport retries only cover failed connection attempts, so they are safe for POSTs too
+            transport = httpx.AsyncHTTPTransport(verify=self.verify, limits=limits or self.limits, retries=self.retries)
+            client = httpx.AsyncClient(base_url=f'https://{host}', transport=transport, timeout=self.timeout)
+            self._clients[api] = client
+        return client
+
+    @property
+    def auth_client(self):
+        return self._client_for('auth', self.auth_host)
+
+    @property
+    def status_client(self):
+        # Long-polled auth_status requests can each hold a connection for a while, so they don't share the push pool
+        return self._client_for('status', self.auth_host, self.status_limits)
+
+    @property
+    def admin_client(self):
+        return self._client_for('admin', self.admin_host)
+
+    async def aclose(self):
+        await self.single_flight.shutdown()
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
     def generate_headers(self, method, path, params):
         if path.startswith('/admin'):
             ikey = self.admin_ikey
@@ -72,23 +173,112 @@ class DuoAuthenticator:
             'Content-Type': 'application/x-www-form-urlencoded'
         })
 
-    def send_push(self, payload):
+    def breaker(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(*self.breaker_settings)
+        return breaker
+
+    async def _send(self, client, method, uri, params, host, priority):
+        # One signed request, admitted by the host's circuit breaker and token bucket
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise DuoUnavailableError(host, breaker.retry_after)
+        try:
+            await self.scheduler.bucket(host).acquire(priority)
+            args, headers = self.generate_headers(method, uri, params)  # Re-signed per attempt with a fresh Date
+            timeout = self.endpoint_timeouts.get(uri, self.timeout)
+            start = time.perf_counter()
+            if method == 'GET':
+                response = await client.get(f'{uri}?{args}', headers=headers, timeout=timeout)
+            else:
+                response = await client.post(uri, headers=headers, content=args, timeout=timeout)
+        except httpx.TransportError:
+            breaker.record(True)  # Includes connect and read timeouts
+            child(DUO_REQUEST_DURATION, uri, host, 'error').observe(time.perf_counter() - start)
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record(response.status_code >= 500)
+        # Duo answers stat OK with a 200 and stat FAIL with an error status
+        child(DUO_REQUEST_DURATION, uri, host, 'OK' if response.status_code == 200 else 'FAIL').observe(time.perf_counter() - start)
+        return response
+
+    async def _hedged(self, send):
+        # Start a second identical request when the first is slow, and keep whichever answers first
+        first = asyncio.create_task(send())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.create_task(send()))
+            error = winner = None
+            while tasks and winner is None:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                    else:
+                        error = task.exception()
+            if winner is None:
+                raise error
+            self.hedge_wins += winner is not first
+            return winner.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _request(self, client, method, uri, params, priority=INTERACTIVE):
+        """
+        Send a signed request through the host's circuit breaker and token bucket, retrying 429 responses
+        after a backoff during which the whole host is paused. Idempotent reads listed in DUO_HEDGE_PATHS
+        are hedged. Returns the last httpx response; raises DuoUnavailableError while the circuit is open.
+        """
+        host = self.admin_host if uri.startswith('/admin') else self.auth_host
+        hedge = self.hedge_delay > 0 and method == 'GET' and uri in self.hedge_paths
+        for attempt in itertools.count():
+            if hedge:
+                response = await self._hedged(lambda: self._send(client, method, uri, params, host, priority))
+            else:
+                response = await self._send(client, method, uri, params, host, priority)
+            if response.status_code != 429 or attempt >= self.scheduler.retries:
+                return response
+            bucket = self.scheduler.bucket(host)
+            bucket.pause(self.scheduler.retry_delay(attempt, response.headers.get('Retry-After')))
+            bucket.retries += 1
+
+    def stats(self):
+        return {
+            'breakers': {host: breaker.stats() for host, breaker in self.breakers.items()},
+            'hedging': {'delay': self.hedge_delay, 'paths': sorted(self.hedge_paths),
+                        'hedges': self.hedges, 'hedge_wins': self.hedge_wins},
+        }
+
+    async def start_push(self, payload):
+        """
+        Send the push asynchronously and return Duo's response (containing the txid) without waiting for the user.
+        Concurrent pushes to the same user (e.g. a double-click) share one push and txid.
+        """
+        return await self.single_flight.do(('push', payload.get("username", "")), self._start_push, payload)
+
+    async def _start_push(self, payload):
         user_email = payload.get("email", "")
         username = payload.get("username", "")
-        device = "auto"  # or extract from payload's devices array if needed
+        device = payload.get("device") or "auto"  # A device id picked from preauth, else Duo's choice
 
         uri = '/auth/v2/auth'
         params = {'username': username, 'factor': 'push', 'device': device, 'async': '1'}
-        body, headers = self.generate_headers('POST', uri, params)
 
-        # Use self.auth_host instead of self.host
-        response = requests.post(f'https://{self.auth_host}{uri}', headers=headers, data=body).json()
+        # Sent over the pooled Auth API session
+        return (await self._request(self.auth_client, 'POST', uri, params)).json()
 
-        if response['stat'] != 'OK':
-            return response
-        return self.check_auth_status(response['response']['txid'])
+    async def send_token(self, payload):
+        key = ('token', payload.get("username", ""), payload.get("token", ""))
+        return await self.single_flight.do(key, self._send_token, payload)
 
-    def send_token(self, payload):
+    async def _send_token(self, payload):
         user_email = payload.get("email", "")
         username = payload.get("username", "")
         token = payload.get("token", "")
@@ -96,74 +286,142 @@ class DuoAuthenticator:
 
         uri = '/auth/v2/auth'
         params = {'username': username, 'factor': 'passcode', 'passcode': token}
-        body, headers = self.generate_headers('POST', uri, params)
 
-        # Use self.auth_host instead of self.host
-        response = requests.post(f'https://{self.auth_host}{uri}', headers=headers, data=body).json()
+        # Sent over the pooled Auth API session
+        response = (await self._request(self.auth_client, 'POST', uri, params)).json()
 
         if response['stat'] != 'OK':
-            return response['message_detail']
+            return response.get('message_detail') or response['message']  # 429s come without a detail
         return response['response']['result']
 
-    def check_auth_status(self, txid, timeout=60, interval=5):
+    async def preauth(self, username):
+        """
+        Duo's /auth/v2/preauth response for username: whether they can authenticate and with which devices.
+        """
+        return await self.single_flight.do(('preauth', username), self._preauth, username)
+
+    async def _preauth(self, username):
+        uri = '/auth/v2/preauth'
+        params = {'username': username}
+        return (await self._request(self.auth_client, 'POST', uri, params)).json()
+
+    async def check_auth_status(self, txid, timeout=None):
+        """
+        Wait for the user to answer the push and return 'allow'/'deny', Duo's error response, or "Error: Timeout".
+        Polls quickly at first (most pushes are answered within seconds) and backs off geometrically
+        while nothing changes. Duo may also hold auth_status open until the status changes (long-poll),
+        in which case each round trip already is the wait and the interval only adds to it briefly.
+        """
         uri = '/auth/v2/auth_status'
         params = {'txid': txid}
-        start_time = time.time()
+        deadline = time.monotonic() + (self.status_timeout if timeout is None else timeout)
+        interval = self.poll_min_interval
+        last_status = None
         while True:
-            if time.time() - start_time > timeout:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "Error: Timeout"
+            try:
+                # A long-polled request must not outlive the deadline either
+                response = await asyncio.wait_for(self._request(self.status_client, 'GET', uri, params), remaining)
+            except asyncio.TimeoutError:
                 return "Error: Timeout"
-            args, headers = self.generate_headers('GET', uri, params)
-            result = requests.get(f'https://{self.auth_host}{uri}?{args}', headers=headers).json()
+            except DuoUnavailableError as e:
+                # The push is already on the phone; keep waiting for Duo to recover until the deadline
+                await asyncio.sleep(min(max(e.retry_after, interval), max(deadline - time.monotonic(), 0)))
+                continue
+            except httpx.TransportError:
+                await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+                continue
+            result = response.json()
             if result['stat'] != 'OK':
                 return result
             if result['response']['result'] in ['allow', 'deny']:
                 return result['response']['result']
-            time.sleep(interval)
+            status = result['response'].get('status')
+            if status != last_status:
+                # Something happened on the device (e.g. pushed -> answered); check again soon
+                interval = self.poll_min_interval
+                last_status = status
+            await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))  # Yield to other requests while the user decides
+            interval = min(interval * self.poll_backoff, self.poll_max_interval)
+
+    def shape_users(self, users):
+        """
+        Keep active/bypass users and reduce each to a DirectoryUser with the fields the helpdesk needs and its activated phones.
+        """
+        result = []
+        for user in users:
+            if user['status'] != 'active' and user['status'] != 'bypass':
+                continue
+            devices = [
+                DirectoryDevice(phone['phone_id'], 'phone', [c for c in phone['capabilities'] if c != 'auto'],
+                                phone['model'], phone['number'])
+                for phone in user['phones'] if phone['activated']
+            ]
+            result.append(DirectoryUser(user['username'], user['realname'], user['email'], user['status'], devices))
+        return result
 
-    def fetch_users(self):
+    async def fetch_users_page(self, offset, limit=USERS_PAGE_SIZE):
         uri = '/admin/v1/users'
-        params_f = '?limit={}&offset={}'
+        params = {'limit': str(limit), 'offset': str(offset)}
+        # Directory syncs yield to pushes and passcodes when the rate limit is reached
+        return (await self._request(self.admin_client, 'GET', uri, params, BACKGROUND)).json()
+
+    def _checked_page(self, response):
+        if response['stat'] != 'OK':
+            raise DuoAPIError(response)
+        logger_manager.logger.debug(f"Admin API users page: {response['metadata']}")
+        return response
+
+    async def iter_user_pages(self):
+        """
+        Yield shaped users one page at a time, in directory order, so callers never need the whole list.
+        Raises DuoAPIError if Duo rejects a page.
+        """
+        response = self._checked_page(await self.fetch_users_page(0))
+        yield self.shape_users(response['response'])
+        next_offset = response['metadata'].get('next_offset')
+        total = response['metadata'].get('total_objects')
+
+        if next_offset and total and self.sync_concurrency > 1:
+            # Plan the remaining offsets from total_objects and keep a window of sync_concurrency pages
+            # in flight (staying under the Admin API rate limit), yielding them in order as they land
+            offsets = iter(range(next_offset, total, USERS_PAGE_SIZE))
+            pending = collections.deque(
+                asyncio.create_task(self.fetch_users_page(offset)) for offset in itertools.islice(offsets, self.sync_concurrency)
+            )
+            try:
+                while pending:
+                    response = self._checked_page(await pending.popleft())
+                    offset = next(offsets, None)
+                    if offset is not None:
+                        pending.append(asyncio.create_task(self.fetch_users_page(offset)))
+                    yield self.shape_users(response['response'])
+            finally:
+                for task in pending:
+                    task.cancel()
+            # Users added since the first page was read spill past the planned offsets
+            next_offset = response['metadata'].get('next_offset')
+
+        while next_offset:
+            response = self._checked_page(await self.fetch_users_page(next_offset))
+            yield self.shape_users(response['response'])
+            next_offset = response['metadata'].get('next_offset')
+
+    async def fetch_users(self, on_page=None):
+        # Consoles loading at once join the directory walk already running (on_page is the first caller's)
+        return await self.single_flight.do(('fetch_users',), self._fetch_users, on_page)
+
+    async def _fetch_users(self, on_page):
         result = []
-        more = True
-        limit = '100'
-        offset = '0'
-        while more:
-            params = params_f.format(limit, offset)
-            body, headers = self.generate_headers('GET', uri, {'limit': limit, 'offset': offset})
-            response = requests.get(f'https://{self.admin_host}{uri}{params}', headers=headers).json()
-            if response['stat'] != 'OK':
-                return response
-            for user in response['response']:
-                if user['status'] != 'active' and user['status'] != 'bypass':
-                    continue
-                user_dict = {
-                    'username': user['username'],
-                    'fullname': user['realname'],
-                    'email': user['email'],
-                    'status': user['status'],
-                }
-                devices = []
-                for phone in user['phones']:
-                    if phone['activated']:
-                        try:
-                            phone['capabilities'].remove('auto')
-                        except ValueError:
-                            pass
-                        devices.append({
-                            'id': phone['phone_id'],
-                            'type': 'phone',
-                            'capabilities': phone['capabilities'],
-                            'model': phone['model'],
-                            'number': phone['number']
-                        })
-                user_dict['devices'] = devices
-                result.append(user_dict)
-            if response['metadata'].get('next_offset'):
-                pprint(response['metadata'])
-                offset = str(response['metadata'].get('next_offset'))
-            else:
-                pprint(response['metadata'])
-                more = False
+        try:
+            async for page in self.iter_user_pages():
+                result.extend(page)
+                if on_page is not None:
+                    on_page(page)
+        except DuoAPIError as e:
+            return e.response
         return result
 
 
@@ -0,0 +1,141 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+# Request priorities; lower goes first when a host's bucket is empty
+INTERACTIVE, BACKGROUND = PRIORITIES = range(2)
+PRIORITY_NAMES = ('interactive', 'background')
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second to one host, with bursts of up to burst. Callers that find the
+    bucket empty queue by priority (then arrival) and are woken as tokens refill. After a 429 the
+    whole host is paused and the bucket drained, so retries trickle back in instead of stampeding.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate  # Tokens per second; <= 0 disables rate limiting (429 backoff still applies)
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []  # Heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self.sent = 0
+        self.queued = [0 for _ in PRIORITIES]  # Requests that had to wait for a token, per priority
+        self.throttled = 0  # 429 responses
+        self.retries = 0
+
+    def _take(self):
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        self.sent += 1
+        return True
+
+    async def acquire(self, priority=INTERACTIVE):
+        if not self.waiters and self._take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future))
+        self.queued[priority] += 1
+        self._dispatch()
+        await future  # A cancelled waiter is skipped by _dispatch
+
+    def _dispatch(self):
+        while self.waiters:
+            future = self.waiters[0][2]
+            if future.done():
+                heapq.heappop(self.waiters)
+            elif self._take():
+                heapq.heappop(self.waiters)
+                future.set_result(None)
+            else:
+                break
+        if self.waiters and self._wakeup is None:
+            now = time.monotonic()
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate if self.rate > 0 else 0, 0.001)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def pause(self, seconds):
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    def stats(self):
+        depth = [0 for _ in PRIORITIES]
+        for priority, _, future in self.waiters:
+            if not future.done():
+                depth[priority] += 1
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'tokens': round(self.tokens, 2),
+            'paused_for': round(max(self.paused_until - time.monotonic(), 0.0), 3),
+            'queue_depth': dict(zip(PRIORITY_NAMES, depth)),
+            'queued': dict(zip(PRIORITY_NAMES, self.queued)),
+            'sent': self.sent,
+            'throttled': self.throttled,
+            'retries': self.retries,
+        }
+
+
+class DuoScheduler:
+    """
+    One TokenBucket per Duo host plus the retry policy for 429 Too Many Requests responses.
+    """
+
+    def __init__(self, rate, burst, retries, backoff, max_backoff):
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+
+    def bucket(self, host):
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def retry_delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number attempt (0-based): Duo's Retry-After when it sends one,
+        otherwise exponential backoff with full jitter so throttled callers don't retry in lockstep.
+        """
+        try:
+            return min(float(retry_after), self.max_backoff)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+    def stats(self):
+        return {host: bucket.stats() for host, bucket in self.buckets.items()}
@@ -18,16 +18,171 @@ import logging
 from config.config import config
 import json
 import logging.handlers
+import atexit
+import os
 import queue
+import select
+import sys
+import time
+from datetime import datetime, timezone
 from rich.logging import RichHandler
 
 # Global variable to hold the table's state
 log_table = []
 
+# Attributes every LogRecord has; anything else was passed through extra= and goes into the JSON line
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the logging code: a record that does not fit in the queue is dropped.
+    With the 'sample' policy, once the queue is half full only 1 in sample_rate DEBUG/INFO records is kept,
+    so warnings and errors still get through a burst. Shed records are decided before they are formatted.
+    """
+
+    def __init__(self, log_queue, policy='drop', sample_rate=10):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.high_water = log_queue.maxsize // 2 or float('inf')  # An unbounded queue is never sampled
+        self.dropped = 0
+        self.sampled_out = 0
+        self._sampled = 0
+
+    def emit(self, record):
+        if self.policy == 'sample' and record.levelno < logging.WARNING and self.queue.qsize() >= self.high_water:
+            self._sampled += 1
+            if self._sampled % self.sample_rate:
+                self.sampled_out += 1
+                return
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+def process_log_file(path):
+    # Workers must not rotate each other's file, so every process writes its own: logs/app.log -> logs/app.<pid>.log
+    root, ext = os.path.splitext(path)
+    return f'{root}.{os.getpid()}{ext}'
+
+
+def rotating_file_handler(settings):
+    """
+    File handler for this process's LOG_FILE (see process_log_file), rotated by time if LOG_FILE_ROTATE_WHEN
+    is set and by size otherwise.
+    """
+    path = process_log_file(settings.LOG_FILE)
+    if settings.LOG_FILE_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(path, when=settings.LOG_FILE_ROTATE_WHEN,
+                                                         backupCount=settings.LOG_FILE_BACKUPS, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(path, maxBytes=settings.LOG_FILE_MAX_BYTES,
+                                                backupCount=settings.LOG_FILE_BACKUPS, encoding='utf-8')
+
+
+class JSONLinesHandler(logging.Handler):
+    """
+    Writes one JSON object per record, a whole batch at a time, through a handler that is only used for its
+    stream (and rollover): stdout, or a rotating file of this process's own. On stdout, which every worker
+    shares, writes are kept to whole lines of at most PIPE_BUF bytes so lines of different workers never mix.
+    """
+
+    def __init__(self, target):
+        super().__init__()
+        self.target = target
+        self.rotating = isinstance(target, logging.handlers.BaseRotatingHandler)
+
+    def to_json(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),  # QueueHandler.prepare already merged args and the traceback
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+    def _should_rollover(self, size):
+        if isinstance(self.target, logging.handlers.TimedRotatingFileHandler):
+            return time.time() >= self.target.rolloverAt
+        return 0 < self.target.maxBytes <= self.target.stream.tell() + size
+
+    def _write_atomic(self, lines):
+        stream = self.target.stream
+        chunk, size = [], 0
+        for line in lines:
+            if chunk and size + len(line) > select.PIPE_BUF:
+                stream.write(''.join(chunk))
+                stream.flush()
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line)  # Characters: exact for the ASCII json.dumps produces
+        if chunk:
+            stream.write(''.join(chunk))
+            stream.flush()
+
+    def handle_batch(self, records):
+        try:
+            lines = [self.to_json(record) + '\n' for record in records]
+            if not self.rotating:
+                self._write_atomic(lines)
+                return
+            data = ''.join(lines)
+            if self._should_rollover(len(data)):
+                self.target.doRollover()
+            self.target.stream.write(data)
+            self.target.stream.flush()
+        except Exception:
+            self.handleError(records[0])
+
+    def emit(self, record):
+        self.handle_batch([record])
+
+    def close(self):
+        self.target.close()
+        super().close()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that drains up to batch_size waiting records at a time and hands each handler the
+    whole batch (handle_batch), so a burst costs one write and flush per batch instead of per record.
+    """
+
+    def __init__(self, log_queue, *handlers, batch_size=500):
+        super().__init__(log_queue, *handlers)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size and batch[-1] is not self._sentinel:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is self._sentinel
+            records = [self.prepare(record) for record in (batch[:-1] if stop else batch)]
+            if records:
+                for handler in self.handlers:
+                    handler.handle_batch(records)
+            if stop:
+                break
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # Waits for room in a full queue instead of raising queue.Full
+
 
 class LoggerManager:
     """
     Centralize logging from multiple processes into a single listener that can output to both a file and the terminal without the messages getting jumbled.
+    In production mode the queue is bounded (see BoundedQueueHandler) and records are written as batched JSON lines, without Rich.
     """
     _instance = None
 
@@ -37,31 +192,47 @@ class LoggerManager:
             cls._instance = cls()
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, settings=config, console=None, name=__name__):
+        self.settings = settings
+        self.mode = settings.LOG_MODE
         self.listener = None
-        self.console = Console()
-        self.log_queue = queue.Queue(-1)  # No limit on size
-        self.queue_handler = logging.handlers.QueueHandler(self.log_queue)
-        self.logger = self.setup()
+        self.console = console or Console()
+        if self.mode == 'production':
+            self.log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+            self.queue_handler = BoundedQueueHandler(self.log_queue, settings.LOG_QUEUE_POLICY, settings.LOG_SAMPLE_RATE)
+        else:
+            self.log_queue = queue.Queue(-1)  # No limit on size
+            self.queue_handler = logging.handlers.QueueHandler(self.log_queue)
+        self.logger = self.setup(name)
         self.original_log_level = self.logger.level
         self.session_logs = {}  # This will store all the logs per session
         self.logger.propagate = False
+        atexit.register(self.shutdown)  # The listener thread is a daemon: write out what is still queued
+
+    def setup(self, name=__name__):
+        settings = self.settings
+        if self.mode == 'production':
+            if settings.LOG_PRODUCTION_OUTPUT == 'file':
+                target = rotating_file_handler(settings)
+            else:
+                target = logging.StreamHandler(sys.stdout)
+            json_handler = JSONLinesHandler(target)
+            self.listener = BatchingQueueListener(self.log_queue, json_handler, batch_size=settings.LOG_BATCH_SIZE)
+        else:
+            log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
-    def setup(self):
-        log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-
-        # Handlers for file and console
-        file_handler = logging.FileHandler("logs/app.log", mode='a')
-        file_handler.setFormatter(logging.Formatter(log_format))
-        console_handler = RichHandler(console=self.console)
+            # Handlers for file and console
+            file_handler = logging.FileHandler(settings.LOG_FILE, mode='a')
+            file_handler.setFormatter(logging.Formatter(log_format))
+            console_handler = RichHandler(console=self.console)
 
-        # Listener that listens to the queue
-        self.listener = logging.handlers.QueueListener(self.log_queue, console_handler, file_handler, respect_handler_level=True)
+            # Listener that listens to the queue
+            self.listener = logging.handlers.QueueListener(self.log_queue, console_handler, file_handler, respect_handler_level=True)
         self.listener.start()
 
         # Setup logger
-        logger = logging.getLogger(__name__)
-        log_level = config.LOGGER_LEVEL
+        logger = logging.getLogger(name)
+        log_level = settings.LOGGER_LEVEL
 
         logger.setLevel(log_level)
         logger.addHandler(self.queue_handler)  # Add QueueHandler
@@ -69,7 +240,22 @@ class LoggerManager:
         return logger
 
     def shutdown(self):
+        if self.listener is None:
+            return
+        self.logger.removeHandler(self.queue_handler)
         self.listener.stop()  # Stop the listener when shutting down
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'queue_depth': self.log_queue.qsize(),
+            'queue_size': self.log_queue.maxsize,
+            'dropped': getattr(self.queue_handler, 'dropped', 0),
+            'sampled_out': getattr(self.queue_handler, 'sampled_out', 0),
+        }
 
     def display_2_column_rich_table(self, data, title):
         """
@@ -12,11 +12,18 @@ IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from config.config import config
 from logrr import logger_manager
+from duo_app import duo_authenticator, DuoUnavailableError
+from push_registry import push_registry
+from directory_cache import directory_cache
+from directory_snapshot import directory_snapshot
+from directory_shared import shared_directory
 from routes import router as webhook_router
+from metrics import PrometheusMiddleware
 import uvicorn
 
 
@@ -31,14 +38,32 @@ def create_app() -> FastAPI:
         allow_methods=["*"],  # Allows all methods
         allow_headers=["*"],  # Allows all headers
     )
+    fastapi_app.add_middleware(PrometheusMiddleware)  # Outermost, so CORS preflights and errors are counted too
+
+    @fastapi_app.exception_handler(DuoUnavailableError)
+    async def duo_unavailable(request: Request, exc: DuoUnavailableError):
+        # Duo's circuit breaker is open: tell the caller right away instead of letting requests pile up
+        return JSONResponse(status_code=503, content={"detail": str(exc)},
+                            headers={"Retry-After": str(max(int(exc.retry_after), 1))})
 
     @fastapi_app.on_event("startup")
     async def on_startup():
         logger_manager.print_start_panel(config.APP_NAME)
         logger_manager.display_config_table(config)  # Display the configuration table using the new function
+        # Serve the directory saved by the previous run right away, then reconcile with Duo in the background
+        snapshot = directory_snapshot.load()
+        if snapshot is not None:
+            directory_cache.seed(*snapshot)
+        shared_directory.start()  # With several workers, only the elected one syncs with Duo
+        if directory_cache.stale:
+            directory_cache.refresh()
 
     @fastapi_app.on_event("shutdown")
     async def on_shutdown():
+        await push_registry.shutdown()
+        await shared_directory.shutdown()
+        await directory_cache.shutdown()
+        await duo_authenticator.aclose()
         logger_manager.print_exit_panel()
 
     fastapi_app.include_router(webhook_router)
@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import functools
+import time
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily
+from logrr import logger_manager
+
+HTTP_REQUESTS = Counter('helpdesk_http_requests_total', 'Requests served, by route and status',
+                        ['method', 'route', 'status'])
+HTTP_REQUEST_DURATION = Histogram('helpdesk_http_request_duration_seconds', 'Time to serve a request, including streamed bodies',
+                                  ['method', 'route'])
+DUO_REQUEST_DURATION = Histogram('helpdesk_duo_request_duration_seconds', 'Duo API round trips (token bucket wait excluded)',
+                                 ['path', 'host', 'stat'])
+PUSH_OUTCOMES = Counter('helpdesk_push_outcomes_total', 'Finished pushes, by outcome', ['outcome'])
+PUSH_ANSWER_TIME = Histogram('helpdesk_push_answer_seconds', 'Time from sending a push to its outcome (outcome="allow" is time to approval)',
+                             ['outcome'], buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, float('inf')))
+DIRECTORY_USERS = Gauge('helpdesk_directory_users', 'Users in the cached directory')
+DIRECTORY_SYNC_DURATION = Histogram('helpdesk_directory_sync_seconds', 'Time to walk the Duo user directory', ['result'],
+                                    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, float('inf')))
+LOG_QUEUE_DEPTH = Gauge('helpdesk_log_queue_depth', 'Log records waiting for the logging listener')
+LOG_QUEUE_DEPTH.set_function(logger_manager.log_queue.qsize)
+
+
+class LogSheddingCollector:
+    # Read from LoggerManager at scrape time, so the logging hot path only bumps plain integers
+    def collect(self):
+        stats = logger_manager.stats()
+        family = CounterMetricFamily('helpdesk_log_records_shed', 'Log records not written because the queue was full or being sampled',
+                                     labels=['reason'])
+        family.add_metric(['queue_full'], stats['dropped'])
+        family.add_metric(['sampled'], stats['sampled_out'])
+        yield family
+
+
+REGISTRY.register(LogSheddingCollector())
+
+PUSH_RESULTS = {'allow': 'allow', 'deny': 'deny', 'Error: Timeout': 'timeout', 'Error: Cancelled': 'cancelled'}
+UNMATCHED_ROUTE = '<unmatched>'  # Not labelled with the raw path, so scanners can't blow up the series count
+
+
+@functools.lru_cache(maxsize=None)
+def child(metric, *labels):
+    # labels() takes a lock and builds a key on every call; label sets are few, so keep the children
+    return metric.labels(*labels)
+
+
+def observe_push(result, seconds):
+    outcome = PUSH_RESULTS.get(result, 'error') if isinstance(result, str) else 'error'
+    child(PUSH_OUTCOMES, outcome).inc()
+    child(PUSH_ANSWER_TIME, outcome).observe(seconds)
+
+
+def render():
+    """
+    (body, content type) of every metric in the Prometheus text format.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class PrometheusMiddleware:
+    """
+    Plain ASGI middleware (unlike BaseHTTPMiddleware it neither buffers nor wraps streamed bodies) that counts
+    and times every HTTP request, labelled by the route's path template rather than the requested URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = None  # endpoint function -> path template
+
+    def route_of(self, scope):
+        if self.routes is None:
+            self.routes = {route.endpoint: route.path for route in scope['app'].routes if hasattr(route, 'endpoint')}
+        return self.routes.get(scope.get('endpoint'), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self.route_of(scope)
+            child(HTTP_REQUEST_DURATION, scope['method'], route).observe(time.perf_counter() - start)
+            child(HTTP_REQUESTS, scope['method'], route, str(status)).inc()
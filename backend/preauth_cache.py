@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import time
+from collections import OrderedDict
+from config.config import config
+from logrr import logger_manager
+from duo_app import duo_authenticator, DuoUnavailableError
+
+
+def push_device(preauth):
+    """
+    Id of the first device the user can approve a push on, or None.
+    """
+    for device in preauth.get('devices', []):
+        if 'push' in device.get('capabilities', []):
+            return device['device']
+    return None
+
+
+class PreauthCache:
+    """
+    Short-lived, size-bounded cache of /auth/v2/preauth per user: the result (auth, allow, deny or
+    enroll), its status message and the user's devices with their capabilities. The UI prefetches it
+    when an agent selects a user, so /push/ and /token/ can refuse hopeless attempts without waiting
+    on Duo and push straight to a known device. Duo errors are not cached.
+    """
+
+    def __init__(self, fetch, ttl=config.PREAUTH_CACHE_TTL, max_size=config.PREAUTH_CACHE_MAX_SIZE,
+                 enabled=config.PREAUTH_ENABLED):
+        self.fetch = fetch  # Coroutine function returning Duo's preauth response for a username
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = enabled
+        self.entries = OrderedDict()  # username -> (fetched_at, preauth), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, username):
+        """
+        The cached preauth for username, fetched when missing or older than ttl. Returns None if Duo fails;
+        raises DuoUnavailableError while the circuit breaker refuses calls to Duo.
+        """
+        entry = self.entries.get(username)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.hits += 1
+            self.entries.move_to_end(username)
+            return entry[1]
+        self.misses += 1
+        try:
+            response = await self.fetch(username)
+        except DuoUnavailableError:
+            self.errors += 1
+            raise
+        except Exception as e:
+            response = {'stat': 'FAIL', 'message': str(e)}
+        if response.get('stat') != 'OK':
+            self.errors += 1
+            logger_manager.logger.warning(f"Preauth for {username} failed: {response.get('message_detail') or response.get('message')}")
+            return None
+        self.entries[username] = (time.monotonic(), response['response'])
+        self.entries.move_to_end(username)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return response['response']
+
+    async def check(self, username, factor):
+        """
+        (reason, preauth): reason is the message to refuse a factor ('push' or 'passcode') with, or None
+        to go ahead. Without a preauth (disabled, or Duo failed) Duo decides at authentication time as before.
+        """
+        if not self.enabled:
+            return None, None
+        try:
+            preauth = await self.get(username)
+        except DuoUnavailableError:
+            preauth = None  # The push or passcode itself then gets the breaker's answer
+        if preauth is None:
+            return None, None
+        if preauth['result'] in ('deny', 'enroll'):
+            return preauth.get('status_msg') or f"Duo {preauth['result']}", preauth
+        if factor == 'push' and preauth['result'] == 'auth' and push_device(preauth) is None:
+            return f"{username} has no device that can approve a push", preauth
+        return None, preauth
+
+    def invalidate(self, username):
+        self.entries.pop(username, None)
+
+    def stats(self):
+        return {'size': len(self.entries), 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+
+preauth_cache = PreauthCache(duo_authenticator.preauth)  # Create a single instance of PreauthCache
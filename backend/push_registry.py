@@ -0,0 +1,144 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from config.config import config
+from logrr import logger_manager
+from metrics import observe_push
+
+
+class PushTransaction:
+    __slots__ = ('txid', 'username', 'created', 'result', 'done', 'task')
+
+    def __init__(self, txid, username):
+        self.txid = txid
+        self.username = username
+        self.created = time.monotonic()
+        self.result = None
+        self.done = asyncio.Event()
+        self.task = None
+
+    def to_dict(self):
+        return {
+            'txid': self.txid,
+            'username': self.username,
+            'status': 'done' if self.done.is_set() else 'pending',
+            'output': self.result,
+        }
+
+
+class PushRegistry:
+    """
+    Bounded, expiring table of push transactions, each polled by its own background task.
+    Entries are kept in creation order, so expired ones are always at the front.
+    The table is per process: a txid another worker sent is adopted (see adopt) by the worker a client
+    asks, while joining a user's pending push only works within the worker that sent it.
+    """
+
+    def __init__(self, max_size=config.PUSH_REGISTRY_MAX_SIZE, ttl=config.PUSH_RESULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.transactions = OrderedDict()
+        self.finished = OrderedDict()  # txid -> transaction with a result, in the order they finished
+        self.pending_by_user = {}  # username -> transaction still waiting for the user
+
+    def _remove(self, transaction):
+        del self.transactions[transaction.txid]
+        self.finished.pop(transaction.txid, None)
+        if self.pending_by_user.get(transaction.username) is transaction:
+            del self.pending_by_user[transaction.username]
+        if transaction.task is not None:
+            transaction.task.cancel()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.transactions:
+            oldest = next(iter(self.transactions.values()))
+            if now - oldest.created <= self.ttl:
+                break
+            self._remove(oldest)
+        # When full, make room by dropping the oldest finished results, never a push that is still being polled
+        while len(self.transactions) >= self.max_size and self.finished:
+            self._remove(next(iter(self.finished.values())))
+
+    def is_full(self):
+        self._expire()
+        return len(self.transactions) >= self.max_size
+
+    def start(self, txid, username, status_coro):
+        """
+        Track txid and await status_coro (e.g. DuoAuthenticator.check_auth_status) in the background.
+        A txid that is already tracked (a coalesced duplicate push) keeps its existing poller.
+        """
+        self._expire()
+        transaction = self.transactions.get(txid)
+        if transaction is not None:
+            status_coro.close()
+            return transaction
+        transaction = PushTransaction(txid, username)
+        transaction.task = asyncio.create_task(self._poll(transaction, status_coro))
+        self.transactions[txid] = transaction
+        if username is not None:
+            self.pending_by_user[username] = transaction
+        return transaction
+
+    def adopt(self, txid, status_coro):
+        """
+        Start following a push sent by another worker (every worker can poll Duo for any txid).
+        Returns None when the table is full of pushes still being polled.
+        """
+        if self.is_full():
+            status_coro.close()
+            return None
+        return self.start(txid, None, status_coro)
+
+    def pending(self, username):
+        """
+        The push to username that is still waiting for an answer, if any.
+        """
+        self._expire()
+        return self.pending_by_user.get(username)
+
+    async def _poll(self, transaction, status_coro):
+        try:
+            transaction.result = await status_coro
+        except asyncio.CancelledError:
+            transaction.result = "Error: Cancelled"
+            raise
+        except Exception as e:
+            logger_manager.logger.error(f"Polling push {transaction.txid} for {transaction.username} failed: {e}")
+            transaction.result = f"Error: {e}"
+        finally:
+            if transaction.username is not None:  # Adopted pushes are counted by the worker that sent them
+                observe_push(transaction.result, time.monotonic() - transaction.created)
+            transaction.task = None
+            if self.pending_by_user.get(transaction.username) is transaction:
+                del self.pending_by_user[transaction.username]
+            if self.transactions.get(transaction.txid) is transaction:
+                self.finished[transaction.txid] = transaction
+            transaction.done.set()
+
+    def get(self, txid):
+        self._expire()
+        return self.transactions.get(txid)
+
+    async def shutdown(self):
+        tasks = [t.task for t in self.transactions.values() if t.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+push_registry = PushRegistry()  # Create a single instance of PushRegistry
@@ -10,11 +10,28 @@ writing, software distributed under the License is distributed on an "AS
 IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
-from fastapi import APIRouter, Request, Depends, HTTPException
+import asyncio
+import json
+import uuid
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse, Response
 from typing import List, Optional
 from pydantic import BaseModel
 from logrr import logger_manager
-from duo_app import duo_authenticator
+from duo_app import duo_authenticator, DuoUnavailableError
+from config.config import config
+from push_registry import push_registry, PushTransaction
+from preauth_cache import preauth_cache, push_device
+from directory_cache import directory_cache
+from directory_store import dumps
+from directory_shared import shared_directory
+from directory_response import directory_responses
+from directory_changes import directory_changes
+from user_index import user_index
+import metrics
+
+SSE_KEEPALIVE_SECONDS = 15
+USERS_STREAM_CHUNK = 500  # Users per NDJSON chunk when replaying the cached directory
 
 router = APIRouter()
 
@@ -36,36 +53,264 @@ class User(BaseModel):
     token: Optional[str] = None
 
 
+async def start_push_transaction(user_request: User):
+    """
+    Send a push to the user, or join the one they already have pending, and return its PushTransaction;
+    returns the preauth refusal message, or Duo's response, instead when the push can't be sent.
+    """
+    pending = push_registry.pending(user_request.username)
+    if pending is not None:
+        # The user already has a push on their phone; follow that one instead of sending another
+        return pending
+    if push_registry.is_full():
+        raise HTTPException(status_code=503, detail="Too many pending pushes, try again shortly")
+    reason, preauth = await preauth_cache.check(user_request.username, 'push')
+    if reason is not None:
+        return reason  # Locked out, not enrolled or nothing to push to: no point bothering Duo or the user
+    user_request_dict = user_request.model_dump()  # Convert the user_request object to a dictionary
+    if preauth is not None and preauth['result'] == 'auth':
+        user_request_dict['device'] = push_device(preauth)
+    response = await duo_authenticator.start_push(user_request_dict)  # Send the push without waiting for the user
+    if response['stat'] != 'OK':
+        return response
+    txid = response['response']['txid']
+    # The result is collected in the background; clients follow it via /push/{txid} or /push/{txid}/events
+    return push_registry.start(txid, user_request.username, duo_authenticator.check_auth_status(txid))
+
+
 @router.post("/push/")
 async def push(user_request: User):
     try:
-        user_request_dict = user_request.model_dump()  # Convert the user_request object to a dictionary
-        result = duo_authenticator.send_push(user_request_dict)  # Pass the user_request_dict to the send_push function
-        # Simulate authentication result for demonstration purposes (optional)
-        # result = "Authentication successful for user: " + user_request.username
-        return {"output": result}
+        transaction = await start_push_transaction(user_request)
+    except (HTTPException, DuoUnavailableError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))  # Log and handle the error
+    if not isinstance(transaction, PushTransaction):
+        return {"output": transaction}
+    return {"output": "pushed", "txid": transaction.txid}
+
+
+async def verify_user(user_request: User, semaphore):
+    result = {"username": user_request.username, "txid": None}
+    async with semaphore:  # Held until the user answers, so it caps the pushes waiting at once
+        try:
+            transaction = await start_push_transaction(user_request)
+            if not isinstance(transaction, PushTransaction):
+                return {**result, "result": "error", "output": transaction}
+            result["txid"] = transaction.txid
+            await transaction.done.wait()
+        except Exception as e:
+            return {**result, "result": "error", "output": getattr(e, 'detail', str(e))}
+    output = transaction.result
+    if output in ('allow', 'deny'):
+        status = output
+    elif output == "Error: Timeout":
+        status = 'timeout'
+    else:
+        status = 'error'
+    return {**result, "result": status, "output": output}
+
+
+async def push_batch_ndjson(users, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.create_task(verify_user(user, semaphore)) for user in users]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + '\n'
+    finally:
+        # The client went away; pushes already sent keep being tracked by the registry
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/push/batch")
+async def push_batch(users: List[User], concurrency: Optional[int] = Query(None, ge=1)):
+    """
+    Push every user and stream one NDJSON line per user as they answer:
+    {"username", "txid", "result": allow|deny|timeout|error, "output"}.
+    At most concurrency (capped by PUSH_BATCH_CONCURRENCY) pushes are outstanding at a time.
+    """
+    if len(users) > config.PUSH_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {config.PUSH_BATCH_MAX_SIZE} users per batch")
+    concurrency = min(concurrency or config.PUSH_BATCH_CONCURRENCY, config.PUSH_BATCH_CONCURRENCY)
+    return StreamingResponse(push_batch_ndjson(users, concurrency), media_type="application/x-ndjson")
+
+
+async def get_push_transaction(txid: str):
+    transaction = push_registry.get(txid)
+    if transaction is None:
+        # Sent by another worker (or before a restart): Duo's txid can be polled from any of them
+        try:
+            uuid.UUID(txid)
+        except ValueError:
+            raise HTTPException(status_code=404, detail=f"Unknown push transaction: {txid}")
+        transaction = push_registry.adopt(txid, duo_authenticator.check_auth_status(txid))
+        if transaction is None:
+            raise HTTPException(status_code=503, detail="Too many pending pushes, try again shortly")
+    return transaction
+
+
+@router.get("/push/{txid}")
+async def push_status(transaction=Depends(get_push_transaction)):
+    return transaction.to_dict()
+
+
+@router.get("/push/{txid}/events")
+async def push_events(transaction=Depends(get_push_transaction)):
+    async def event_stream():
+        # Server-sent events: comment lines keep proxies from closing the idle connection
+        while not transaction.done.is_set():
+            try:
+                await asyncio.wait_for(transaction.done.wait(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+        yield f"event: result\ndata: {json.dumps(transaction.to_dict())}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @router.post("/token/")
 async def token(user_request: User):
     try:
+        reason, _ = await preauth_cache.check(user_request.username, 'passcode')
+        if reason is not None:
+            return {"output": reason}
         user_request_dict = user_request.model_dump()  # Convert the user_request object to a dictionary
-        result = duo_authenticator.send_token(user_request_dict)  # Pass the user_request_dict to the send_push function
+        result = await duo_authenticator.send_token(user_request_dict)  # Pass the user_request_dict to the send_push function
+        if result != 'allow':
+            preauth_cache.invalidate(user_request.username)  # Failed passcodes can lock the user out
         # Simulate authentication result for demonstration purposes (optional)
         # result = "Authentication successful for user: " + user_request.username
         return {"output": result}
+    except DuoUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))  # Log and handle the error
 
+def json_output(output):
+    # Directory users write their own JSON (see directory_store.dumps); FastAPI's encoder would need dicts
+    return Response(content=dumps({"output": output}), media_type="application/json")
+
+
+async def cached_user_pages(users, start=0):
+    for i in range(start, len(users), USERS_STREAM_CHUNK):
+        yield users[i:i + USERS_STREAM_CHUNK]
+
+
+async def users_ndjson():
+    # Replay the cached snapshot in chunks. A cold cache is filled by the shared refresh, so consoles
+    # opening at once follow a single directory walk, each getting its pages as they land.
+    users = directory_cache.cached()  # Refreshed in the background when stale, like /users/
+    sent = 0
+    if users is None:
+        refresh = directory_cache.refresh()
+        try:
+            async for page in directory_cache.walk.follow():
+                sent += len(page)
+                yield ''.join([user.to_json() + '\n' for user in page])
+            users = await asyncio.shield(refresh)
+        except Exception as e:
+            users = str(e) or type(e).__name__
+        if not isinstance(users, list):
+            # Headers are already sent, so report the failure as the last line
+            logger_manager.console.print(f"[red]Error: {users}[/red]")
+            yield json.dumps({"error": users}) + '\n'
+            return
+    # Whatever the walk didn't stream, e.g. a snapshot loaded whole from the syncing worker
+    async for page in cached_user_pages(users, sent):
+        yield ''.join([user.to_json() + '\n' for user in page])
+
+
 @router.get("/users/")
-def users():
+async def users(request: Request, stream: bool = False):
     try:
         logger_manager.console.print('[orange1]Fetching users...[/orange1]')
-        result = duo_authenticator.fetch_users()
-        return {"output": result}
+        if stream:
+            return StreamingResponse(users_ndjson(), media_type="application/x-ndjson")
+        result = await directory_cache.get()  # Served from the cache, refreshed in the background
+        if result is directory_changes.users:
+            # Conditional and compressed, keyed by the version's content digest
+            return await directory_responses.respond(request, result, directory_changes.digest)
+        return json_output(result)
     except Exception as e:
         # Log and handle the error
         logger_manager.console.print(f"[red]Error: {e}[/red]")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/users/{username}/preauth")
+async def user_preauth(username: str):
+    """
+    The user's Duo preauth (result, status message, devices), cached briefly. The UI calls this as soon
+    as an agent selects a user, so the following /push/ or /token/ doesn't wait on Duo for it.
+    """
+    preauth = await preauth_cache.get(username)
+    if preauth is None:
+        raise HTTPException(status_code=502, detail=f"Duo preauth for {username} failed")
+    return {"output": {**preauth, "push_device": push_device(preauth)}}
+
+
+@router.get("/users/search")
+async def users_search(q: str = '', limit: int = Query(20, ge=1, le=100)):
+    try:
+        result = await directory_cache.get()  # Makes sure the index is populated (and refreshed when stale)
+        if not isinstance(result, list):
+            return {"output": result}
+        return json_output(user_index.search(q, limit))
+    except Exception as e:
+        logger_manager.console.print(f"[red]Error: {e}[/red]")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/users/changes")
+async def users_changes(since: Optional[str] = None):
+    """
+    Users added, changed and removed since the version a client already holds; start with no since.
+    """
+    try:
+        result = await directory_cache.get()  # Makes sure a version exists (and is refreshed when stale)
+        if not isinstance(result, list):
+            return {"output": result}
+        return json_output(directory_changes.since(since))
+    except Exception as e:
+        logger_manager.console.print(f"[red]Error: {e}[/red]")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/users/cache")
+async def users_cache():
+    return {**directory_cache.stats(), 'shared': shared_directory.stats(), 'responses': directory_responses.stats()}
+
+
+@router.get("/duo/scheduler")
+async def duo_scheduler():
+    """
+    Per Duo host: rate limit tokens, queue depth by priority, and 429 throttle/retry counters.
+    """
+    return duo_authenticator.scheduler.stats()
+
+
+@router.get("/duo/single-flight")
+async def duo_single_flight():
+    """
+    Duo calls in flight, and how many callers joined an identical call instead of starting their own.
+    """
+    return duo_authenticator.single_flight.stats()
+
+
+@router.get("/duo/health")
+async def duo_health():
+    """
+    Circuit breaker state per Duo host, and hedged request counters.
+    """
+    return duo_authenticator.stats()
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """
+    Route, Duo call, push, directory and logging metrics for Prometheus to scrape.
+    """
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,52 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight, later callers with the
+    same key await the same task (and get the same result or exception) instead of starting another.
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> task
+        self.started = 0
+        self.shared = 0
+
+    def _forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here too, in case every caller went away
+
+    async def do(self, key, coro_fn, *args):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.create_task(coro_fn(*args))
+            task.add_done_callback(lambda task: self._forget(key, task))
+            self.calls[key] = task
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)  # One caller disconnecting must not cancel the call for the others
+
+    async def shutdown(self):
+        tasks = list(self.calls.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {'in_flight': len(self.calls), 'started': self.started, 'shared': self.shared}
@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at https://developer.cisco.com/docs/licenses.
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+import bisect
+import re
+from collections import defaultdict
+from directory_changes import directory_changes
+
+# Rank of the field a token came from; matches on lower ranks come first in search results
+USERNAME, USERNAME_PART, FULLNAME, EMAIL = RANKS = range(4)
+TOKEN_SPLIT = re.compile(r'[\s._@+-]+')
+BUCKET_PREFIX = 2  # Tokens are bucketed by their first characters to keep sorted lists short
+
+# Above this share of changed users a full rebuild is cheaper than patching buckets
+FULL_REBUILD_RATIO = 0.1
+# Above this many entry changes a bucket is re-sorted instead of patched one entry at a time
+BUCKET_PATCH_LIMIT = 64
+
+
+def user_tokens(user):
+    """
+    The (token, rank) pairs a user can be found by: whole username and email, plus each of their words.
+    """
+    tokens = set()
+    username = (user.username or '').lower()
+    if username:
+        tokens.add((username, USERNAME))
+        tokens.update((part, USERNAME_PART) for part in TOKEN_SPLIT.split(username) if part and part != username)
+    for word in TOKEN_SPLIT.split((user.fullname or '').lower()):
+        if word:
+            tokens.add((word, FULLNAME))
+    email = (user.email or '').lower()
+    if email:
+        tokens.add((email, EMAIL))
+        tokens.update((part, EMAIL) for part in TOKEN_SPLIT.split(email) if part)
+    return tokens
+
+
+class UserIndex:
+    """
+    Prefix index over username, fullname and email. For each field rank, tokens are kept as sorted
+    (token, username) lists bucketed by prefix, so a lookup is a bisect followed by an in-order scan.
+    Scanning ranks in order yields results already ranked, and the scan stops after limit users.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.tokens = {}  # username -> set of (token, rank)
+        self.buckets = [{} for _ in RANKS]  # rank -> {token prefix: sorted [(token, username)]}
+
+    def __len__(self):
+        return len(self.users)
+
+    def rebuild(self, users):
+        self.users = {user.username: user for user in users}
+        self.tokens = {username: user_tokens(user) for username, user in self.users.items()}
+        buckets = [{} for _ in RANKS]
+        for username, tokens in self.tokens.items():
+            for token, rank in tokens:
+                buckets[rank].setdefault(token[:BUCKET_PREFIX], []).append((token, username))
+        for rank_buckets in buckets:
+            for bucket in rank_buckets.values():
+                bucket.sort()
+        self.buckets = buckets
+
+    def apply(self, delta):
+        """
+        DirectoryChanges listener: patch the index with a delta, re-indexing only the users it touches.
+        """
+        if not self.users or len(delta) > FULL_REBUILD_RATIO * len(delta.users):
+            self.rebuild(delta.users)
+            return
+        new_users = {user.username: user for user in delta.added + delta.changed}
+        touched = list(new_users) + delta.removed
+        dropped = defaultdict(set)  # (rank, prefix) -> entries leaving the bucket
+        added = defaultdict(list)  # (rank, prefix) -> entries joining the bucket
+        for username in touched:
+            old_tokens = self.tokens.pop(username, set())
+            if username in new_users:
+                self.users[username] = new_users[username]
+                self.tokens[username] = new_tokens = user_tokens(new_users[username])
+            else:
+                self.users.pop(username, None)
+                new_tokens = set()
+            # Most changes (status, devices) leave the searchable tokens alone
+            for token, rank in old_tokens - new_tokens:
+                dropped[rank, token[:BUCKET_PREFIX]].add((token, username))
+            for token, rank in new_tokens - old_tokens:
+                added[rank, token[:BUCKET_PREFIX]].append((token, username))
+        for rank, prefix in dropped.keys() | added.keys():
+            bucket = self.buckets[rank].setdefault(prefix, [])
+            leaving, joining = dropped.get((rank, prefix), set()), added.get((rank, prefix), [])
+            if len(leaving) + len(joining) <= BUCKET_PATCH_LIMIT:
+                for entry in leaving:
+                    del bucket[bisect.bisect_left(bucket, entry)]
+                for entry in joining:
+                    bisect.insort(bucket, entry)
+            else:
+                bucket[:] = sorted([entry for entry in bucket if entry not in leaving] + joining)
+            if not bucket:
+                del self.buckets[rank][prefix]
+
+    def _matches(self, rank, term):
+        # (token, username) entries of this rank whose token starts with term, in token order
+        buckets = self.buckets[rank]
+        if len(term) >= BUCKET_PREFIX:
+            prefixes = [term[:BUCKET_PREFIX]]
+        else:
+            prefixes = sorted(prefix for prefix in buckets if prefix.startswith(term))
+        for prefix in prefixes:
+            bucket = buckets.get(prefix, ())
+            i = bisect.bisect_left(bucket, (term,))
+            while i < len(bucket) and bucket[i][0].startswith(term):
+                yield bucket[i]
+                i += 1
+
+    def _has_prefix(self, username, term):
+        return any(token.startswith(term) for token, _ in self.tokens[username])
+
+    def _match_count(self, term):
+        # Number of entries starting with term, from two bisects per bucket
+        count = 0
+        end = term + '\uffff'
+        for rank in RANKS:
+            buckets = self.buckets[rank]
+            if len(term) >= BUCKET_PREFIX:
+                prefixes = [term[:BUCKET_PREFIX]]
+            else:
+                prefixes = [prefix for prefix in buckets if prefix.startswith(term)]
+            for prefix in prefixes:
+                bucket = buckets.get(prefix, ())
+                count += bisect.bisect_left(bucket, (end,)) - bisect.bisect_left(bucket, (term,))
+        return count
+
+    def search(self, query, limit=20):
+        """
+        Users matching every word of query as a prefix of their username, name or email.
+        Ranked by the field that matched the most selective word (username first), exact matches before prefixes.
+        """
+        terms = set(term for term in TOKEN_SPLIT.split(query.lower()) if term)
+        # Scan the rarest word's matches and check the other words against each candidate's tokens
+        primary = min(terms, key=self._match_count) if len(terms) > 1 else next(iter(terms), '')
+        others = terms - {primary}
+        results = []
+        seen = set()
+        for rank in RANKS:
+            for token, username in self._matches(rank, primary):
+                if username in seen:
+                    continue
+                seen.add(username)
+                if all(self._has_prefix(username, term) for term in others):
+                    results.append(self.users[username])
+                    if len(results) >= limit:
+                        return results
+        return results
+
+
+user_index = UserIndex()  # Create a single instance of UserIndex
+directory_changes.add_listener(user_index.apply)  # Re-index whenever the directory changes
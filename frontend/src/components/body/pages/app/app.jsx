@@ -37,21 +37,30 @@ const AppPage = () => {
     "No caller action required yet."
   );
   const [users, setUsers] = useState([]); // State to store the fetched users
+  const [userQuery, setUserQuery] = useState("");
 
-  // Fetch users from the backend
+  // Search users on the backend as the agent types instead of downloading the whole directory
   useEffect(() => {
-    const fetchUsers = async () => {
+    let cancelled = false;
+    const searchUsers = async () => {
       try {
-        const response = await axios.get(`${API_URL}/users/`);
-        console.log(response);
-        setUsers(response.data.output); // Assuming the response has an 'output' field with user data
+        const response = await axios.get(`${API_URL}/users/search`, {
+          params: { q: userQuery, limit: 20 },
+        });
+        if (!cancelled) {
+          setUsers(response.data.output); // Assuming the response has an 'output' field with user data
+        }
       } catch (error) {
         console.error("Error fetching users:", error);
       }
     };
 
-    fetchUsers();
-  }, []);
+    const timer = setTimeout(searchUsers, 150); // Debounce keystrokes
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [userQuery]);
 
   const handleSendPush = async () => {
     if (!selectedUser) {
@@ -78,25 +87,52 @@ const AppPage = () => {
         `${API_URL}/push/`,
         userRequest
       );
-      if (response.data.output) {
-        setOutput(response.data.output)
-        setCallerViewText(
-          `Push notification sent to ${selectedUser.username}. Awaiting response...`
-        );
-      } else {
-        setOutput("No response received");
-        setCallerViewText(
-          `Push notification sent to ${selectedUser.username}. Awaiting response...`
-        );
+      if (!response.data.txid) {
+        // Duo rejected the push outright (e.g. unknown user), nothing to wait for
+        setOutput(response.data.output || "No response received");
+        setIsRequestSent(true);
+        setIsLoading(false);
+        return;
       }
-      setIsRequestSent(true);
+      setCallerViewText(
+        `Push notification sent to ${selectedUser.username}. Awaiting response...`
+      );
+      // The backend returns immediately; the result arrives as a server-sent event
+      const events = new EventSource(
+        `${API_URL}/push/${response.data.txid}/events`
+      );
+      events.addEventListener("result", (event) => {
+        events.close();
+        const transaction = JSON.parse(event.data);
+        setOutput(transaction.output || "No response received");
+        setIsRequestSent(true);
+        setIsLoading(false);
+      });
+      events.onerror = async () => {
+        // Stream dropped: fall back to polling the status until the push is answered
+        events.close();
+        try {
+          let status = await axios.get(
+            `${API_URL}/push/${response.data.txid}`
+          );
+          while (status.data.status === "pending") {
+            await new Promise((resolve) => setTimeout(resolve, 2000));
+            status = await axios.get(`${API_URL}/push/${response.data.txid}`);
+          }
+          setOutput(status.data.output || "No response received");
+        } catch (error) {
+          console.error("Error:", error);
+          setOutput("An error occurred");
+        }
+        setIsRequestSent(true);
+        setIsLoading(false);
+      };
     } catch (error) {
       console.error("Error:", error);
       setOutput("An error occurred");
       setCallerViewText(
         `Push notification to ${selectedUser.username} failed!`
       );
-    } finally {
       setIsLoading(false);
     }
   };
@@ -199,8 +235,18 @@ const AppPage = () => {
               value={selectedUser}
               onChange={(event, newValue) => {
                 setSelectedUser(newValue);
+                if (newValue) {
+                  // Warm the backend's preauth cache so the push or passcode check doesn't wait on it
+                  axios
+                    .get(`${API_URL}/users/${encodeURIComponent(newValue.username)}/preauth`)
+                    .catch((error) => console.error("Error prefetching preauth:", error));
+                }
               }}
               options={users}
+              filterOptions={(options) => options} // Already filtered and ranked by the backend
+              onInputChange={(event, newInputValue) => {
+                setUserQuery(newInputValue);
+              }}
               getOptionLabel={(option) => option.username || ""}
               renderInput={(params) => (
                 <TextField